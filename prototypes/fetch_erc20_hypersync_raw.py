@@ -39,7 +39,7 @@ async def fetch_erc20s():
         res = await client.send_req(query)
 
         # read json abi file for erc20
-        with open('./src/degen_tracker/abis/erc20.json', 'r') as json_file:
+        with open('./prototypes/abis/erc20.json', 'r') as json_file:
             abi = json_file.read()
 
         # Map of contract_address -> abi
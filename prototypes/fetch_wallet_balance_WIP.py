@@ -54,7 +54,7 @@ async def wallet_balance():
         res = await client.send_req(query)
 
         # read json abi file for erc20
-        with open('./src/degen_tracker/abis/erc20.json', 'r') as json_file:
+        with open('./prototypes/abis/erc20.json', 'r') as json_file:
             abi = json_file.read()
 
         # Map of contract_address -> abi
@@ -0,0 +1,177 @@
+import asyncio
+import os
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+import re
+
+from dataclasses import dataclass, field
+from degen_tracker.hypersync import Hypersync
+from degen_tracker.lance import KEY_COLUMNS, LOGS_SCHEMA, LanceDBLogs
+from degen_tracker.maintenance import LanceMaintenance
+from degen_tracker.memory import StagedChunk, record_batches
+from degen_tracker.pipeline import SyncPipeline
+from typing import Iterator, List, Tuple, Union
+
+# the logs table schema without the derived key columns, which are added again when loading
+PARTITION_SCHEMA = pa.schema([f for f in LOGS_SCHEMA if f.name not in KEY_COLUMNS.values()])
+PARTITION_FILE = re.compile(r"blocks=(\d+)-(\d+)\.parquet$")
+
+
+@dataclass
+class PartitionChunker:
+    """
+    Chunks a SyncPipeline into a fixed list of partitions instead of sizing chunks adaptively.
+    """
+    partitions: List[Tuple[int, int]]
+
+    def chunks(self, start_block: int, end_block: int) -> Iterator[Tuple[int, int]]:
+        return iter(self.partitions)
+
+    def observe(self, blocks: int, rows: int, nbytes: int):
+        pass
+
+
+@dataclass
+class PartitionChunk(StagedChunk):
+    """
+    The partition files of a load commit, streamed into LanceDBLogs.append_db one record batch at a time
+    like a spilled StagedChunk, so a commit is never held in memory as a whole.
+    """
+    paths: List[str] = field(default_factory=list)
+    # rows per record batch read from the partition files
+    batch_size: int = 65_536
+
+    def __len__(self) -> int:
+        return sum(pq.ParquetFile(path).metadata.num_rows for path in self.paths)
+
+    def estimated_size(self) -> int:
+        return sum(os.path.getsize(path) for path in self.paths)
+
+    def batches(self) -> Iterator[pa.RecordBatch]:
+        for path in self.paths:
+            yield from pq.ParquetFile(path).iter_batches(batch_size=self.batch_size)
+
+    def to_df(self) -> pl.DataFrame:
+        return pl.from_arrow(pa.Table.from_batches(self.batches(), schema=PARTITION_SCHEMA))
+
+
+@dataclass
+class ParquetBackfill:
+    """
+    Backfills history into block range partitioned parquet files, then bulk loads them into the logs table.
+
+    Fetching and loading are separate steps. The fetch is bound by the network and the load by lance,
+    so neither waits for the other, and lance gets a few large commits rather than one per chunk.
+
+    Partitions are aligned to multiples of partition_blocks and written atomically as
+    `blocks=<start>-<end>.parquet`, so a file that exists is complete. An interrupted fetch resumes at the
+    first missing partition. Every partition has PARTITION_SCHEMA, including empty ones, so partitions
+    always read back with the same types.
+
+    Example:
+        backfill = ParquetBackfill(path="backfill", concurrency=8)
+        backfill.fetch(start_block=0, end_block=15_000_000)
+        backfill.load(LanceDBLogs())
+    """
+    path: str = "backfill"
+    partition_blocks: int = 10_000
+    concurrency: int = 4
+    client: Hypersync = field(default_factory=Hypersync)
+
+    def partitions(self, start_block: int, end_block: int) -> List[Tuple[int, int]]:
+        """
+        The [start, end) partitions covering [start_block, end_block), aligned to partition_blocks.
+        """
+        partitions = []
+        block = start_block
+        while block < end_block:
+            end = min((block // self.partition_blocks + 1) * self.partition_blocks, end_block)
+            partitions.append((block, end))
+            block = end
+        return partitions
+
+    def written(self) -> List[Tuple[int, int]]:
+        """
+        The partitions written so far, in block order.
+        """
+        if not os.path.isdir(self.path):
+            return []
+        matches = (PARTITION_FILE.match(name) for name in os.listdir(self.path))
+        return sorted((int(match[1]), int(match[2])) for match in matches if match)
+
+    def partition_path(self, start_block: int, end_block: int) -> str:
+        # zero padded, so partition files also sort by block in a directory listing
+        return os.path.join(self.path, f"blocks={start_block:012d}-{end_block:012d}.parquet")
+
+    def fetch(self, start_block: int, end_block: int = None):
+        """
+        Fetches the partitions of [start_block, end_block) that have not been written yet.
+        """
+        asyncio.run(self._fetch(start_block, end_block))
+
+    async def _fetch(self, start_block: int, end_block: int):
+        if end_block is None:
+            end_block = await self.client.get_block_height()
+
+        written = set(self.written())
+        pending = [partition for partition in self.partitions(start_block, end_block) if partition not in written]
+        print(f'backfill: {len(pending)} partitions to fetch, {len(written)} already written')
+        if not pending:
+            return
+
+        os.makedirs(self.path, exist_ok=True)
+        pipeline = SyncPipeline(client=self.client, write=self.write_partition,
+                                chunker=PartitionChunker(pending), concurrency=self.concurrency)
+        await pipeline.run(pending[0][0], pending[-1][1])
+
+    def write_partition(self, data: Union[pl.DataFrame, StagedChunk], start_block: int, end_block: int):
+        """
+        Atomically writes the rows of [start_block, end_block) as one partition file, one record batch at
+        a time.
+        """
+        path = self.partition_path(start_block, end_block)
+        with pq.ParquetWriter(path + ".tmp", PARTITION_SCHEMA) as writer:
+            for batch in record_batches(data):
+                writer.write_table(pa.Table.from_batches([batch]).select(PARTITION_SCHEMA.names)
+                                   .cast(PARTITION_SCHEMA))
+        os.replace(path + ".tmp", path)
+
+    def load(self, logs: LanceDBLogs, rows_per_commit: int = 5_000_000) -> int:
+        """
+        Bulk loads the written partitions into the logs table, merging adjacent partitions into commits of
+        up to rows_per_commit rows. The partitions of a commit are streamed into lance one record batch at
+        a time, see PartitionChunk, so rows_per_commit bounds the size of a lance commit but not the memory
+        of the load. Partitions that are already committed to the table are skipped, so an interrupted load
+        resumes where it stopped. Indexes are built once at the end.
+
+        Returns:
+            int: the number of rows loaded.
+        """
+        rows = 0
+        for start_block, end_block, paths in self._commits(rows_per_commit):
+            if not logs.manifest.uncommitted(start_block, end_block):
+                continue
+            chunk = PartitionChunk(paths=paths)
+            print('loading blocks', start_block, 'to', end_block, '-', len(chunk), 'rows')
+            rows += logs.append_db(chunk, start_block, end_block)
+
+        if logs.logs_tbl is not None:
+            logs.create_indexes()
+            LanceMaintenance(logs.db, logs.uri, logs.maintenance_policy).run_once(force=True)
+
+        return rows
+
+    def _commits(self, rows_per_commit: int) -> Iterator[Tuple[int, int, List[str]]]:
+        # adjacent partitions are merged, reading only the row counts from the parquet footers
+        group, group_rows = [], 0
+        for start, end in self.written():
+            path = self.partition_path(start, end)
+            partition_rows = pq.ParquetFile(path).metadata.num_rows
+            if group and (start != group[-1][1] or group_rows + partition_rows > rows_per_commit):
+                yield group[0][0], group[-1][1], [self.partition_path(*partition) for partition in group]
+                group, group_rows = [], 0
+            group.append((start, end))
+            group_rows += partition_rows
+        if group:
+            yield group[0][0], group[-1][1], [self.partition_path(*partition) for partition in group]
@@ -0,0 +1,206 @@
+import numpy as np
+import polars as pl
+import time
+
+from dataclasses import dataclass, field
+from degen_tracker import uint256
+from degen_tracker.decode import to_bytes
+from degen_tracker.manifest import BlockRanges
+from degen_tracker.state import GenerationStore
+from typing import Dict, List, Optional, Tuple, Union
+
+BALANCES_SCHEMA = {"wallet": pl.Binary, "token": pl.Binary, "balance": pl.Binary}
+# mints are transfers from and burns transfers to the zero address, which has no meaningful balance
+ZERO_ADDRESS = bytes(20)
+
+Address = Union[str, bytes]
+
+
+def net_transfers(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Nets a batch of transfers into one balance change per (wallet, token).
+
+    Every transfer credits transfer_to and debits transfer_from. Debits are added as the two's complement
+    of the value, so the whole batch is a single vectorized uint256 group by sum, see
+    degen_tracker.uint256.group_sum_uint256.
+
+    Returns:
+        pl.DataFrame: wallet, token and balance, the net change as a uint256 word modulo 2**256.
+    """
+    credits = df.select(pl.col("transfer_to").alias("wallet"), "token",
+                        pl.col("value_transferred").alias("balance"))
+    debits = df.select(pl.col("transfer_from").alias("wallet"), "token",
+                       pl.from_arrow(uint256.negate(df["value_transferred"])).alias("balance"))
+    changes = pl.concat([credits, debits]).filter(pl.col("wallet") != ZERO_ADDRESS)
+
+    return uint256.group_sum_uint256(changes, ["wallet", "token"], "balance").cast(BALANCES_SCHEMA)
+
+
+@dataclass
+class WalletBalances:
+    """
+    Materialized (wallet, token) -> balance table, kept in memory and persisted next to the logs table.
+
+    Balances are updated from each ingested batch, so they never replay history. The block ranges
+    applied so far are tracked the same way as in the sync manifest, so a batch is applied exactly once.
+    Ranges committed to the logs table but lost from the balances (e.g. after a crash before the last
+    save) are read back from the table by catch_up.
+
+    Balances are held as a (pairs, 8) uint256 limb matrix with a hash index from (wallet, token) to its
+    row, so applying a batch costs in proportion to the pairs it touches and lookups don't scan the table.
+
+    Balances are exact uint256 words. A wallet that received tokens before the first synced block wraps
+    around below zero, so balances are only meaningful for tables synced from the token's deployment.
+    """
+    path: str
+    applied: BlockRanges = field(default_factory=BlockRanges)
+    # seconds between saves, batches applied since the last save are recovered by catch_up
+    save_interval: float = 30.0
+    generation: int = 0
+    last_save: float = field(default_factory=time.monotonic)
+    _rows: Dict[bytes, int] = field(default_factory=dict, repr=False)
+    _wallet_rows: Dict[bytes, List[int]] = field(default_factory=dict, repr=False)
+    _pairs: List[bytes] = field(default_factory=list, repr=False)
+    _limbs: np.ndarray = field(default_factory=lambda: np.zeros((1024, uint256.LIMBS), np.uint64), repr=False)
+
+    @property
+    def store(self) -> GenerationStore:
+        return GenerationStore(path=self.path, names=("balances",))
+
+    @classmethod
+    def load(cls, path: str, save_interval: float = 30.0) -> "WalletBalances":
+        """
+        Loads the balances saved at path, or returns empty balances if there are none yet.
+        """
+        saved = cls(path=path).store.load()
+        if saved is None:
+            return cls(path=path, save_interval=save_interval)
+        state, frames = saved
+
+        balances = cls(path=path, save_interval=save_interval,
+                       applied=BlockRanges(ranges=[tuple(r) for r in state["ranges"]], rows=state["rows"]),
+                       generation=state["generation"])
+        balances._merge(frames["balances"])
+
+        return balances
+
+    @property
+    def state(self) -> pl.DataFrame:
+        """
+        All non zero balances as wallet, token and balance columns.
+        """
+        return self._frame(np.arange(len(self._pairs)))
+
+    def save(self):
+        """
+        Saves the balances and their ranges as a new generation, see GenerationStore.
+        """
+        self.generation = self.store.save(self.generation,
+                                          {"ranges": self.applied.ranges, "rows": self.applied.rows},
+                                          {"balances": self.state})
+        self.last_save = time.monotonic()
+
+    def apply(self, df: pl.DataFrame, ranges: List[Tuple[int, int]]):
+        """
+        Applies the transfers of a batch holding every row of the [start, end) block ranges.
+        Blocks that were already applied are skipped.
+        """
+        gaps = [gap for start, end in ranges for gap in self.applied.uncommitted(start, end)]
+        if not gaps:
+            return
+        if gaps != list(ranges) and not df.is_empty():
+            df = df.filter(pl.any_horizontal(
+                [pl.col("block_number").is_between(start, end, closed="left") for start, end in gaps]))
+
+        if not df.is_empty():
+            self._merge(net_transfers(df))
+        for start, end in gaps:
+            self.applied.commit(start, end)
+        self.applied.rows += len(df)
+
+        if time.monotonic() - self.last_save > self.save_interval:
+            self.save()
+
+    def _row(self, wallet: bytes, token: bytes) -> int:
+        pair = wallet + token
+        row = self._rows.get(pair)
+        if row is None:
+            row = self._rows[pair] = len(self._pairs)
+            self._pairs.append(pair)
+            self._wallet_rows.setdefault(wallet, []).append(row)
+        return row
+
+    def _merge(self, changes: pl.DataFrame):
+        if changes.is_empty():
+            return
+        rows = np.fromiter((self._row(wallet, token) for wallet, token
+                            in zip(changes["wallet"].to_list(), changes["token"].to_list())),
+                           dtype=np.int64, count=len(changes))
+        if len(self._pairs) > len(self._limbs):
+            grown = np.zeros((max(len(self._pairs), 2 * len(self._limbs)), uint256.LIMBS), np.uint64)
+            grown[:len(self._limbs)] = self._limbs
+            self._limbs = grown
+
+        # changes hold one row per pair, so the fancy indexed add never hits a row twice
+        self._limbs[rows] = uint256.normalize(self._limbs[rows] + uint256.limbs(changes["balance"]))
+
+    def _frame(self, rows: np.ndarray) -> pl.DataFrame:
+        rows = rows[self._limbs[rows].any(axis=1)]
+        pairs = [self._pairs[row] for row in rows]
+
+        return pl.DataFrame({
+            "wallet": [pair[:20] for pair in pairs],
+            "token": [pair[20:] for pair in pairs],
+            "balance": pl.from_arrow(uint256.from_limbs(self._limbs[rows])),
+        }, schema=BALANCES_SCHEMA)
+
+    def catch_up(self, logs_tbl, committed: BlockRanges) -> int:
+        """
+        Applies the ranges committed to the logs table that have not been applied yet, reading only their
+        rows and the columns the balances need.
+
+        Returns:
+            int: the number of transfers applied.
+        """
+        gaps = [gap for start, end in committed.ranges for gap in self.applied.uncommitted(start, end)]
+        if not gaps or logs_tbl is None:
+            return 0
+
+        predicate = " OR ".join(f"(block_number >= {start} AND block_number < {end})" for start, end in gaps)
+        df = pl.from_arrow(logs_tbl.to_lance().to_table(
+            columns=["block_number", "token", "transfer_from", "transfer_to", "value_transferred"],
+            filter=predicate))
+        self.apply(df, gaps)
+        self.save()
+
+        return len(df)
+
+    def lookup(self, wallets: List[Address], tokens: Optional[List[Address]] = None) -> pl.DataFrame:
+        """
+        Batch lookup of the balances of wallets, optionally only for some tokens.
+
+        Returns:
+            pl.DataFrame: wallet, token and balance for every held (wallet, token) pair, pairs without a
+            balance are left out.
+        """
+        wallets = [to_bytes(wallet) if isinstance(wallet, str) else wallet for wallet in wallets]
+        if tokens is None:
+            rows = [row for wallet in wallets for row in self._wallet_rows.get(wallet, ())]
+        else:
+            tokens = [to_bytes(token) if isinstance(token, str) else token for token in tokens]
+            pairs = (wallet + token for wallet in wallets for token in tokens)
+            rows = [row for row in map(self._rows.get, pairs) if row is not None]
+
+        return self._frame(np.array(rows, dtype=np.int64))
+
+    def balance(self, wallet: Address, token: Address) -> int:
+        """
+        Point lookup of a single balance, 0 if the wallet never held the token.
+        """
+        wallet = to_bytes(wallet) if isinstance(wallet, str) else wallet
+        token = to_bytes(token) if isinstance(token, str) else token
+        row = self._rows.get(wallet + token)
+        if row is None:
+            return 0
+
+        return uint256.to_int(uint256.from_limbs(self._limbs[row:row + 1])[0].as_py())
@@ -0,0 +1,250 @@
+"""
+Offline ingest and query benchmarks, served by a ReplayClient instead of hypersync.
+
+    python -m degen_tracker.bench --blocks 20000 --latency 0.02 --concurrency 4
+    python -m degen_tracker.bench --only fetch,metrics --json results.json
+
+Every benchmark runs in a fresh process in a temporary directory, so its peak RSS is its own and no
+table is shared between benchmarks.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import numpy as np
+import os
+import tempfile
+import time
+
+from dataclasses import asdict, dataclass, field
+from degen_tracker.memory import peak_rss
+from typing import Callable, Dict, List
+
+
+@dataclass
+class BenchConfig:
+    blocks: int = 20_000
+    transfers_per_block: int = 20
+    # simulated hypersync round trip, in seconds
+    latency: float = 0.01
+    jitter: float = 0.005
+    blocks_per_page: int = 1_000
+    concurrency: int = 4
+    # rows per update_db call
+    batch_rows: int = 100_000
+    # repetitions of each query
+    queries: int = 50
+
+    def client(self):
+        from degen_tracker.hypersync import Hypersync
+        from degen_tracker.replay import ReplayClient, SyntheticSource
+
+        source = SyntheticSource(height=self.blocks, transfers_per_block=self.transfers_per_block)
+        return Hypersync(client=ReplayClient(source, latency=self.latency, jitter=self.jitter,
+                                             blocks_per_page=self.blocks_per_page))
+
+
+@dataclass
+class BenchResult:
+    name: str
+    rows: int = 0
+    seconds: float = 0.0
+    # latency samples in seconds, per stage
+    latencies: Dict[str, List[float]] = field(default_factory=dict)
+    peak_rss: int = 0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def sample(self, stage: str, seconds: float):
+        self.latencies.setdefault(stage, []).append(seconds)
+
+    def summary(self) -> dict:
+        return {
+            "name": self.name,
+            "rows": self.rows,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows_per_second),
+            "peak_rss_mb": round(self.peak_rss / 2 ** 20, 1),
+            "stages": {stage: {"samples": len(samples),
+                               "p50_ms": round(float(np.percentile(samples, 50)) * 1000, 3),
+                               "p99_ms": round(float(np.percentile(samples, 99)) * 1000, 3)}
+                       for stage, samples in self.latencies.items()},
+        }
+
+
+def _timed(result: BenchResult, stage: str, fn: Callable) -> Callable:
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            result.sample(stage, time.perf_counter() - start)
+    return wrapper
+
+
+def bench_fetch(config: BenchConfig) -> BenchResult:
+    """
+    Hypersync.fetch_erc20s over the whole range.
+    """
+    result = BenchResult("fetch_erc20s")
+    client = config.client()
+    start = time.perf_counter()
+    data = asyncio.run(client.fetch_erc20s(0, config.blocks, concurrency=config.concurrency))
+    result.seconds = time.perf_counter() - start
+    result.rows = data["log_data"].num_rows
+    result.latencies["request"] = client.client.latencies
+    return result
+
+
+def bench_get_erc20_df(config: BenchConfig) -> BenchResult:
+    """
+    Hypersync.get_erc20_df over the whole range, i.e. fetch and decode.
+    """
+    result = BenchResult("get_erc20_df")
+    client = config.client()
+    client.page_to_df = _timed(result, "decode", client.page_to_df)
+    start = time.perf_counter()
+    df = client.get_erc20_df(0, config.blocks, concurrency=config.concurrency)
+    result.seconds = time.perf_counter() - start
+    result.rows = len(df)
+    result.latencies["request"] = client.client.latencies
+    return result
+
+
+def bench_db_sync(config: BenchConfig) -> BenchResult:
+    """
+    LanceDBLogs.db_sync into a new table, through the pipelined append path.
+    """
+    from degen_tracker.lance import LanceDBLogs
+
+    result = BenchResult("db_sync")
+    client = config.client()
+    client.page_to_df = _timed(result, "decode", client.page_to_df)
+    logs = LanceDBLogs(client=client)
+    logs.append_db = _timed(result, "append_db", logs.append_db)
+    start = time.perf_counter()
+    logs.db_sync(0, config.blocks, concurrency=config.concurrency, maintenance=False)
+    result.seconds = time.perf_counter() - start
+    result.rows = logs.logs_tbl.count_rows()
+    result.latencies["request"] = client.client.latencies
+    return result
+
+
+def bench_update_db(config: BenchConfig) -> BenchResult:
+    """
+    LanceDBLogs.update_db upserts of batch_rows rows, on data fetched beforehand.
+    """
+    from degen_tracker.lance import LanceDBLogs
+
+    result = BenchResult("update_db")
+    df = config.client().get_erc20_df(0, config.blocks, concurrency=config.concurrency)
+    logs = LanceDBLogs(client=config.client())
+    update_db = _timed(result, "update_db", logs.update_db)
+    start = time.perf_counter()
+    for offset in range(0, len(df), config.batch_rows):
+        update_db(df.slice(offset, config.batch_rows))
+    result.seconds = time.perf_counter() - start
+    result.rows = len(df)
+    return result
+
+
+def bench_metrics(config: BenchConfig) -> BenchResult:
+    """
+    Metrics refresh and queries, and wallet lookups, on a table synced beforehand.
+    rows/s is the rate of the initial refresh, which folds the whole table.
+    """
+    from degen_tracker.lance import LanceDBLogs
+    from degen_tracker.metrics import Metrics
+
+    result = BenchResult("metrics")
+    logs = LanceDBLogs(client=config.client())
+    logs.db_sync(0, config.blocks, concurrency=config.concurrency, maintenance=False)
+    logs.create_indexes()
+    logs.logs_tbl.to_lance().optimize.optimize_indices()
+
+    metrics = Metrics()
+    start = time.perf_counter()
+    result.rows = metrics.refresh()
+    result.seconds = time.perf_counter() - start
+    result.sample("refresh", result.seconds)
+
+    count_transfers = _timed(result, "count_transfers", metrics.count_transfers)
+    group_by_addresses = _timed(result, "group_by_addresses_window", metrics.group_by_addresses)
+    wallet_history = _timed(result, "wallet_history", logs.wallet_history)
+    wallets = logs.logs_tbl.to_lance().to_table(columns=["transfer_from"], limit=config.queries)["transfer_from"]
+    for i in range(config.queries):
+        count_transfers(limit=100)
+        group_by_addresses(since_block=max(0, config.blocks - 1000), limit=100)
+        wallet_history(wallets[i % len(wallets)].as_py())
+    return result
+
+
+BENCHMARKS = {
+    "fetch": bench_fetch,
+    "get_erc20_df": bench_get_erc20_df,
+    "db_sync": bench_db_sync,
+    "update_db": bench_update_db,
+    "metrics": bench_metrics,
+}
+
+
+def _run_isolated(name: str, config: BenchConfig, results: multiprocessing.Queue):
+    with tempfile.TemporaryDirectory() as path:
+        # tables and state files are created relative to the working directory
+        os.chdir(path)
+        try:
+            result = BENCHMARKS[name](config)
+        except Exception as e:
+            results.put({"name": name, "error": repr(e)})
+            raise
+        result.peak_rss = peak_rss()
+        results.put(result.summary())
+
+
+def run(names: List[str], config: BenchConfig) -> List[dict]:
+    """
+    Runs the benchmarks, each in a fresh process, and returns their summaries.
+    """
+    context = multiprocessing.get_context("spawn")
+    summaries = []
+    for name in names:
+        results = context.Queue()
+        process = context.Process(target=_run_isolated, args=(name, config, results))
+        process.start()
+        summary = results.get()
+        process.join()
+        summaries.append(summary)
+        print_summary(summary)
+    return summaries
+
+
+def print_summary(summary: dict):
+    if "error" in summary:
+        print(f"{summary['name']}: failed with {summary['error']}")
+        return
+    print(f"{summary['name']}: {summary['rows']} rows in {summary['seconds']} s, "
+          f"{summary['rows_per_second']} rows/s, peak rss {summary['peak_rss_mb']} MB")
+    for stage, stats in summary["stages"].items():
+        print(f"    {stage:<28} {stats['samples']:>6} samples  p50 {stats['p50_ms']:>10} ms  p99 {stats['p99_ms']:>10} ms")
+
+
+def main():
+    defaults = BenchConfig()
+    parser = argparse.ArgumentParser(description="Offline ingest and query benchmarks.")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="comma separated benchmarks to run")
+    parser.add_argument("--json", help="also write the results to this json file")
+    for name, value in asdict(defaults).items():
+        parser.add_argument("--" + name.replace("_", "-"), type=type(value), default=value)
+    args = parser.parse_args()
+
+    config = BenchConfig(**{name: getattr(args, name) for name in asdict(defaults)})
+    summaries = run(args.only.split(","), config)
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({"config": asdict(config), "results": summaries}, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple
+
+
+@dataclass
+class AdaptiveChunker:
+    """
+    Sizes block range chunks so each write lands close to target_rows rows and target_bytes bytes.
+
+    erc20 activity per block varies by orders of magnitude over a chain's history, so a fixed block range
+    alternates between tiny fragments and chunks that don't fit in memory. The chunker keeps a moving
+    average of the rows and bytes per block observed in written chunks and sizes the next chunk from it.
+    Each chunk is at most twice or at least half the previous one, so a single odd chunk doesn't swing
+    the size.
+    """
+    target_rows: int = 500_000
+    target_bytes: int = 128 * 1024 * 1024
+    initial_blocks: int = 2_500
+    min_blocks: int = 10
+    max_blocks: int = 250_000
+    # weight of the newest observation in the moving averages
+    smoothing: float = 0.5
+    rows_per_block: Optional[float] = None
+    bytes_per_block: Optional[float] = None
+    # planned size of the last chunk, before it was cut short by the end of the range
+    last_blocks: Optional[int] = None
+
+    def next_size(self) -> int:
+        """
+        Returns the number of blocks for the next chunk.
+        """
+        if self.rows_per_block is None:
+            size = self.initial_blocks
+        else:
+            size = self.max_blocks
+            if self.rows_per_block > 0:
+                size = min(size, self.target_rows / self.rows_per_block)
+            if self.bytes_per_block > 0:
+                size = min(size, self.target_bytes / self.bytes_per_block)
+            if self.last_blocks is not None:
+                size = min(max(size, self.last_blocks / 2), self.last_blocks * 2)
+
+        return int(min(max(size, self.min_blocks), self.max_blocks))
+
+    def observe(self, blocks: int, rows: int, nbytes: int):
+        """
+        Records the size of a written chunk of `blocks` blocks.
+        """
+        if blocks <= 0:
+            return
+        rows_per_block = rows / blocks
+        bytes_per_block = nbytes / blocks
+
+        if self.rows_per_block is None:
+            self.rows_per_block = rows_per_block
+            self.bytes_per_block = bytes_per_block
+        else:
+            self.rows_per_block += self.smoothing * (rows_per_block - self.rows_per_block)
+            self.bytes_per_block += self.smoothing * (bytes_per_block - self.bytes_per_block)
+
+    def chunks(self, start_block: int, end_block: int) -> Iterator[Tuple[int, int]]:
+        """
+        Yields (start, end) chunks covering [start_block, end_block), including a shorter chunk at the tail.
+        The size is computed when each chunk is requested, so observations made meanwhile are used.
+        """
+        block = start_block
+        while block < end_block:
+            self.last_blocks = self.next_size()
+            end = min(block + self.last_blocks, end_block)
+            yield block, end
+            block = end
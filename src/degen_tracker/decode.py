@@ -0,0 +1,293 @@
+import functools
+import numpy as np
+import polars as pl
+import pyarrow as pa
+import pyarrow.compute as pc
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+
+def binary_matrix(arr, width: int) -> np.ndarray:
+    """
+    Views a binary arrow array or polars series whose values are all `width` bytes long as a (rows, width) uint8 matrix.
+
+    The values are cast to fixed size binary so the matrix is a view over the arrow buffer instead of
+    a python object per row.
+    """
+    if isinstance(arr, pl.Series):
+        arr = arr.to_arrow()
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    if len(arr) == 0:
+        return np.empty((0, width), dtype=np.uint8)
+    arr = pc.cast(arr, pa.binary(width))
+    data = np.frombuffer(arr.buffers()[1], dtype=np.uint8)
+    start = arr.offset * width
+
+    return data[start:start + len(arr) * width].reshape(len(arr), width)
+
+
+def fixed_size_binary(matrix: np.ndarray) -> pa.FixedSizeBinaryArray:
+    """
+    Wraps a (rows, width) uint8 matrix as a fixed size binary arrow array.
+    """
+    matrix = np.ascontiguousarray(matrix)
+    return pa.FixedSizeBinaryArray.from_buffers(pa.binary(matrix.shape[1]), len(matrix),
+                                                [None, pa.py_buffer(matrix)])
+
+
+def hex_expr(column: str) -> pl.Expr:
+    """
+    Polars expression rendering a binary column as a 0x prefixed hex string.
+    """
+    return pl.concat_str([pl.lit("0x"), pl.col(column).bin.encode("hex")]).alias(column)
+
+
+# addresses and hashes are stored as fixed size binary, these columns are rendered as hex for readers
+HEX_COLUMNS = ("tx_hash", "token", "transfer_from", "transfer_to", "from", "to")
+
+
+def hex_view(df: Union[pl.DataFrame, pl.LazyFrame], columns: Tuple[str, ...] = HEX_COLUMNS) -> Union[pl.DataFrame, pl.LazyFrame]:
+    """
+    Renders the binary address and hash columns of df as 0x prefixed hex strings.
+    """
+    return df.with_columns([hex_expr(column) for column in columns if column in df.columns])
+
+
+def to_bytes(value: str) -> bytes:
+    """
+    Converts a 0x prefixed hex address or hash to the bytes stored in the logs table.
+    """
+    return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+
+
+def address_keys(values) -> np.ndarray:
+    """
+    int64 lookup keys of 20 byte addresses: their last 8 bytes.
+
+    Lance only builds scalar indexes on numeric and string columns, so address lookups go through an
+    indexed key column and are then matched exactly on the address. The last bytes are used because the
+    first ones are shared by whole families of busy addresses: the OP stack predeploys (e.g. WETH at
+    0x4200...0006 on Base), the precompiles and the zero address, and leading zero vanity addresses.
+    Those differ in their trailing bytes, and the trailing bytes of other addresses are hash bytes, so
+    keys of different addresses rarely collide.
+    """
+    return np.ascontiguousarray(binary_matrix(values, 20)[:, 12:]).view('>i8').astype(np.int64).ravel()
+
+
+def decode_word(words: np.ndarray, abi_type: str) -> pa.Array:
+    """
+    Decodes a (rows, 32) matrix of abi encoded words of a static abi type into an arrow array.
+    """
+    if abi_type == "address":
+        # addresses are the last 20 bytes of the 32 byte word
+        return fixed_size_binary(words[:, 12:])
+    if abi_type.startswith("uint") or abi_type == "bytes32":
+        # unsigned integers are kept as exact 32 byte big endian words, see the uint256 module
+        return fixed_size_binary(words)
+    if abi_type == "bool":
+        return pa.array(words[:, 31] != 0, pa.bool_())
+
+    raise ValueError(f"unsupported abi type {abi_type}")
+
+
+# output columns every decoded event has, and the hypersync log field they are read from
+LOG_COLUMNS = {
+    "block_number": "block_number",
+    "transaction_index": "transaction_index",
+    "tx_hash": "transaction_hash",
+    "address": "address",
+}
+
+
+@dataclass(frozen=True)
+class EventParam:
+    name: str
+    abi_type: str
+    indexed: bool
+
+
+@dataclass(frozen=True)
+class EventSpec:
+    """
+    A log event that can be decoded column by column.
+
+    signature is the human readable event signature, e.g.
+    "Transfer(address indexed from, address indexed to, uint256 value)". Indexed parameters are part of
+    the signature, which tells an erc20 Transfer apart from an erc721 Transfer sharing the same topic0.
+    topic0 is the keccak hash of the canonical signature.
+    columns renames decoded parameters and the emitting "address" in the output table.
+    """
+    signature: str
+    topic0: str
+    columns: Dict[str, str] = field(default_factory=dict)
+
+    # hypersync log fields every decode reads to match logs of this event
+    MATCH_FIELDS = ("topic0", "topic1", "topic2", "topic3", "data")
+
+    @property
+    def name(self) -> str:
+        return self.signature.split("(", 1)[0].strip()
+
+    @functools.cached_property
+    def params(self) -> List[EventParam]:
+        inputs = self.signature.split("(", 1)[1].rsplit(")", 1)[0]
+        params = []
+        for param in inputs.split(","):
+            parts = param.split()
+            params.append(EventParam(name=parts[-1], abi_type=parts[0], indexed="indexed" in parts[1:-1]))
+
+        return params
+
+    @functools.cached_property
+    def log_fields(self) -> Dict[str, str]:
+        """
+        The hypersync log field each output column is decoded from, in output order.
+        """
+        fields = dict(LOG_COLUMNS)
+        indexed = [param for param in self.params if param.indexed]
+        for i, param in enumerate(indexed):
+            fields[param.name] = f"topic{i + 1}"
+        for param in self.params:
+            if not param.indexed:
+                fields[param.name] = "data"
+
+        return {self.columns.get(name, name): log_field for name, log_field in fields.items()}
+
+    def decode(self, logs: pa.Table, columns: Optional[Sequence[str]] = None) -> pa.Table:
+        """
+        Decodes the logs of this event from a hypersync arrow log table.
+
+        Logs with a different topic0 or a different number of topics or data words are dropped.
+        columns limits the output to these columns, the others are neither read nor decoded, so the log
+        table only needs their fields and MATCH_FIELDS. Defaults to every column.
+
+        Returns:
+            pa.Table: block_number, transaction_index, tx_hash, the emitting address and one column per
+            event parameter.
+        """
+        indexed = [param for param in self.params if param.indexed]
+        data = [param for param in self.params if not param.indexed]
+        wanted = set(self.log_fields if columns is None else columns)
+
+        matches = pc.equal(logs["topic0"], pa.scalar(bytes.fromhex(self.topic0[2:]), pa.binary()))
+        for i in range(1, 4):
+            has_topic = pc.is_valid(logs[f"topic{i}"])
+            matches = pc.and_(matches, has_topic if i <= len(indexed) else pc.invert(has_topic))
+        matches = pc.and_(matches, pc.equal(pc.binary_length(logs["data"]), 32 * len(data)))
+        logs = logs.filter(pc.fill_null(matches, False))
+
+        def is_wanted(name: str) -> bool:
+            return self.columns.get(name, name) in wanted
+
+        decoded = {}
+        for name, log_field in LOG_COLUMNS.items():
+            if is_wanted(name):
+                decoded[name] = logs[log_field]
+        for i, param in enumerate(indexed):
+            if is_wanted(param.name):
+                decoded[param.name] = decode_word(binary_matrix(logs[f"topic{i + 1}"], 32), param.abi_type)
+        if any(is_wanted(param.name) for param in data):
+            words = binary_matrix(logs["data"], 32 * len(data))
+            for i, param in enumerate(data):
+                if is_wanted(param.name):
+                    decoded[param.name] = decode_word(words[:, 32 * i:32 * (i + 1)], param.abi_type)
+
+        return pa.table({self.columns.get(name, name): column for name, column in decoded.items()})
+
+
+@dataclass
+class EventRegistry:
+    """
+    Event specs keyed by event signature, decoded without any per contract address map.
+    """
+    events: Dict[str, EventSpec] = field(default_factory=dict)
+
+    def register(self, spec: EventSpec) -> EventSpec:
+        # check the signature parses and only uses static types before it is used on a page
+        for param in spec.params:
+            decode_word(np.zeros((0, 32), dtype=np.uint8), param.abi_type)
+        self.events[spec.signature] = spec
+
+        return spec
+
+    def get(self, signature: str) -> EventSpec:
+        if signature not in self.events:
+            raise ValueError(f"Event {signature!r} is not registered, the registered events are {list(self.events)}")
+        return self.events[signature]
+
+
+TRANSFER = EventSpec(
+    signature="Transfer(address indexed from, address indexed to, uint256 value)",
+    topic0="0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef",
+    columns={"address": "token", "from": "transfer_from", "to": "transfer_to", "value": "value_transferred"})
+
+APPROVAL = EventSpec(
+    signature="Approval(address indexed owner, address indexed spender, uint256 value)",
+    topic0="0x8c5be1e5ebec7d5bd14f71427d1e84f3dd0314c0f7b2291e5b200ac8c7c3b925",
+    columns={"address": "token"})
+
+UNISWAP_V2_SWAP = EventSpec(
+    signature="Swap(address indexed sender, uint256 amount0In, uint256 amount1In, uint256 amount0Out, "
+              "uint256 amount1Out, address indexed to)",
+    topic0="0xd78ad95fa46c994b6551d0da85fc275fe613ce37657fb8d5e3d130840159d822",
+    columns={"address": "pair"})
+
+
+@functools.lru_cache(maxsize=None)
+def default_registry() -> EventRegistry:
+    """
+    The process wide event registry. Built once, register additional events on the returned registry.
+    """
+    registry = EventRegistry()
+    for spec in (TRANSFER, APPROVAL, UNISWAP_V2_SWAP):
+        registry.register(spec)
+
+    return registry
+
+
+def transaction_keys(block_number, transaction_index) -> np.ndarray:
+    """
+    Packs (block_number, transaction_index) into a single sortable uint64 key.
+    Transaction indexes fit in 24 bits and block numbers in the remaining 40.
+    """
+    block_number = np.asarray(block_number, dtype=np.uint64)
+    transaction_index = np.asarray(transaction_index, dtype=np.uint64)
+
+    return (block_number << np.uint64(24)) | transaction_index
+
+
+def assemble_transfers(transfers: pa.Table, transactions: pa.Table,
+                       columns: Tuple[str, ...] = ("from", "to")) -> pa.Table:
+    """
+    Adds the transaction `columns` to decoded transfers without a hash join.
+
+    Hypersync returns logs and transactions sorted by (block_number, transaction_index), so every transfer
+    finds its transaction with a binary search over the packed integer keys, which is a sorted merge of the
+    two sides. Transfers without a matching transaction get nulls, like a left join.
+    """
+    if transactions.num_rows == 0:
+        return _with_columns(transfers, {column: pa.nulls(transfers.num_rows, pa.binary()) for column in columns})
+
+    log_keys = transaction_keys(transfers["block_number"], transfers["transaction_index"])
+    tx_keys = transaction_keys(transactions["block_number"], transactions["transaction_index"])
+    order = None
+    if np.any(tx_keys[1:] < tx_keys[:-1]):
+        # only reached if a page is not sorted, sort it rather than fall back to a hash join
+        order = np.argsort(tx_keys, kind="stable")
+        tx_keys = tx_keys[order]
+
+    positions = np.minimum(np.searchsorted(tx_keys, log_keys), len(tx_keys) - 1)
+    found = tx_keys[positions] == log_keys
+    if order is not None:
+        positions = order[positions]
+    indices = pa.array(positions, mask=~found)
+
+    return _with_columns(transfers, {column: transactions[column].take(indices) for column in columns})
+
+
+def _with_columns(table: pa.Table, columns: Dict[str, pa.Array]) -> pa.Table:
+    for name, column in columns.items():
+        table = table.append_column(name, column)
+
+    return table
@@ -0,0 +1,159 @@
+import asyncio
+import polars as pl
+
+from dataclasses import dataclass, field
+from degen_tracker.maintenance import LanceMaintenance
+from degen_tracker.memory import StagedChunk
+from degen_tracker.pipeline import SyncPipeline
+from degen_tracker.tail import TailStore
+from typing import List
+
+
+@dataclass
+class TailBatch:
+    """
+    The rows of the blocks in [start_block, end_block), as published to LiveFollower subscribers.
+    """
+    df: pl.DataFrame
+    start_block: int
+    end_block: int
+
+
+@dataclass
+class LiveFollower:
+    """
+    Follows the chain head on a single event loop with a single hypersync client.
+
+    The block height is polled every poll_interval seconds, and new blocks are fetched as soon as they
+    appear, buffered in the tail store and published to every subscriber queue. Nothing is reopened or
+    rescanned between polls, so the delay from a block to its subscribers is about one poll interval
+    plus one request.
+
+    A subscriber that falls behind loses its oldest batches rather than stalling the follower, see
+    subscribe(). A failed poll or fetch is logged and retried with exponential backoff up to max_backoff
+    seconds, resuming after the last buffered block. While it runs, the follower maintains the logs table
+    and its wallet balances like db_sync does.
+
+    The follower writes to the logs table, so it must be the only writer of that table. Other processes
+    should only read it, e.g. with Metrics.
+
+    Example:
+        async def main():
+            follower = LiveFollower(TailStore(LanceDBLogs()))
+            batches = follower.subscribe()
+            task = asyncio.create_task(follower.run())
+            while True:
+                batch = await next_batch(batches, task)
+                print(batch.end_block - 1, len(batch.df))
+
+        asyncio.run(main())
+    """
+    tail: TailStore
+    poll_interval: float = 0.5
+    concurrency: int = 1
+    # write the buffered blocks to lance when the follower stops
+    flush_on_stop: bool = True
+    # run compaction, index optimization and cleanup of the logs table in the background
+    maintenance: bool = True
+    max_backoff: float = 30.0
+    # polls or fetches that failed and were retried
+    errors: int = 0
+    subscribers: List[asyncio.Queue] = field(default_factory=list)
+    # batches dropped because a subscriber queue was full
+    dropped: int = 0
+    _stop: asyncio.Event = field(default=None, repr=False)
+    _loop: asyncio.AbstractEventLoop = field(default=None, repr=False)
+
+    def subscribe(self, maxsize: int = 64) -> asyncio.Queue:
+        """
+        Returns a queue that receives a TailBatch for every batch of new blocks, in block order.
+        When the queue is full, its oldest batch is dropped to make room.
+        """
+        queue = asyncio.Queue(maxsize=maxsize)
+        self.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.remove(queue)
+
+    async def run(self):
+        """
+        Follows the chain until stop() is called.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        client = self.tail.client
+        pipeline = SyncPipeline(client=client, write=self._write, chunker=self.tail.chunker,
+                                concurrency=self.concurrency)
+        logs = self.tail.logs
+        maintainer = LanceMaintenance(logs.db, logs.uri, logs.maintenance_policy)
+        if self.maintenance:
+            maintainer.start()
+        backoff = self.poll_interval
+        try:
+            while not self._stop.is_set():
+                try:
+                    last_block = self.tail.last_block()
+                    start_block = last_block + 1 if last_block is not None else 0
+                    height = await client.get_block_height()
+                    if height > start_block:
+                        await pipeline.run(start_block, height)
+                        backoff = self.poll_interval
+                        continue
+                    backoff = self.poll_interval
+                except Exception as e:
+                    # the tail only holds fully written chunks, so the next attempt resumes after them
+                    self.errors += 1
+                    backoff = min(backoff * 2, self.max_backoff)
+                    print(f'follower: {e!r}, retrying in {backoff}s')
+
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=backoff)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            try:
+                if self.flush_on_stop:
+                    await asyncio.to_thread(self.tail.flush, True)
+                if logs.balances is not None:
+                    # balances are saved every save_interval while following, the rest is caught up from
+                    # the logs table on the next start
+                    await asyncio.to_thread(logs.balances.save)
+            finally:
+                await asyncio.to_thread(maintainer.stop)
+
+    def stop(self):
+        """
+        Stops following after the batch in progress, thread safe.
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+    def _write(self, chunk: StagedChunk, start_block: int, end_block: int):
+        # runs in the pipeline's writer thread, while the queues belong to the event loop
+        df = chunk.to_df()
+        self.tail.append(df, start_block, end_block)
+        self._loop.call_soon_threadsafe(self._publish, TailBatch(df, start_block, end_block))
+
+    def _publish(self, batch: TailBatch):
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(batch)
+
+
+async def next_batch(batches: asyncio.Queue, task: asyncio.Task) -> TailBatch:
+    """
+    Waits for the next batch of a subscriber queue, or raises if the follower task ends first, so a
+    subscriber never waits forever on a follower that has died.
+    """
+    getter = asyncio.ensure_future(batches.get())
+    done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+    if getter in done:
+        return getter.result()
+
+    getter.cancel()
+    # raises the error the follower stopped with
+    task.result()
+    raise RuntimeError("The follower stopped")
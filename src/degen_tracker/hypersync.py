@@ -1,19 +1,38 @@
 import asyncio
+import collections
+import dataclasses
 import hypersync
-import os
 import polars as pl
+import pyarrow as pa
 from dataclasses import dataclass, field
-from typing import List
-from hypersync import TransactionField, HypersyncClient, LogField
+from degen_tracker import telemetry
+from degen_tracker.planner import FetchPlan, plan_fetch
+from typing import AsyncIterator, List, Sequence, Tuple
+from hypersync import HypersyncClient
 
 
 @dataclass
 class Hypersync:
-    client: HypersyncClient = field(
-        default_factory=lambda: HypersyncClient("https://base.hypersync.xyz"))
+    url: str = "https://base.hypersync.xyz"
+    # any client with get_height() and send_req_arrow(), e.g. degen_tracker.replay.ReplayClient offline
+    client: HypersyncClient = None
     transactions: List[hypersync.TransactionField] = field(
         default_factory=list)
     blocks: List[hypersync.BlockField] = field(default_factory=list)
+    # fields requested and columns decoded, defaults to every column of the logs table, see plan_fetch()
+    plan: FetchPlan = None
+
+    def __post_init__(self):
+        if self.client is None:
+            self.client = HypersyncClient(self.url)
+        if self.plan is None:
+            self.plan = plan_fetch()
+
+    def with_columns(self, columns: Sequence[str]) -> "Hypersync":
+        """
+        Returns a Hypersync sharing this client that only fetches and decodes columns, see plan_fetch().
+        """
+        return dataclasses.replace(self, plan=plan_fetch(columns, self.plan.event))
 
     def convert_hex_to_float(self, hex: str) -> float:
         """
@@ -39,152 +58,229 @@ class Hypersync:
         """
         return await self.client.get_height()
 
-    def get_erc20_df(self, start_block: int, end_block: int) -> pl.DataFrame:
+    def get_erc20_df(self, start_block: int, end_block: int, concurrency: int = 1) -> pl.DataFrame:
         """
-        sync_erc20s() is a synchronous wrapper function around the asynchronous fetch_erc20s() function.
-
-        sync is a boolean value that determines whether to sync all erc20 transfers from block 0 or from the latest block. It is False by default.
-        If false, it will simply sync to the block head.
+        get_erc20_df() is a synchronous wrapper function around the asynchronous iter_erc20_batches() function.
+        It collects every page into a single dataframe, so prefer iter_erc20_batches() for large block ranges.
 
         block_start is the block number to start syncing from
         block_end is the block number to end syncing at
+        concurrency is the maximum number of hypersync requests in flight, see fetch_erc20s()
 
         Returns:
-            dict: A dictionary containing the following keys:
-                {
-                    "tx_data": tx_data,
-                    "decoded_log_data": decoded_log_data,
-                    "log_data": log_data,
-                    "block_data": block_data
-                }
-        """
-        data_dict = asyncio.run(self.fetch_erc20s(start_block=start_block,
-                                                  end_block=end_block))
-        # data transformations
-        joined_logs = []
-        # check if data_dict["log_data"] is None. If it is, then pass
-        if data_dict["log_data"] is None:
+            pl.DataFrame: erc20 transfers joined with the sender and recipient of their transaction.
+        """
+        async def collect_batches() -> List[pl.DataFrame]:
+            return [batch async for batch in self.iter_erc20_batches(start_block=start_block,
+                                                                     end_block=end_block,
+                                                                     concurrency=concurrency)]
+
+        batches = asyncio.run(collect_batches())
+        if not batches:
             return pl.DataFrame()
 
-        for i in range(len(data_dict["log_data"])):
-            log = {
-                "block_number": data_dict["log_data"][i].block_number,
-                "tx_hash": data_dict["log_data"][i].transaction_hash,
-                "indexed": data_dict["decoded_log_data"][i].indexed,
-                # contains value transferred. Make float to avoid overflow errors
-                "body": float(data_dict["decoded_log_data"][i].body[0]),
-            }
-            joined_logs.append(log)
+        return pl.concat(batches)
 
-        tx_data = []
+    async def iter_erc20_batches(self, start_block: int, end_block: int, concurrency: int = 1,
+                                 shard_size: int = None) -> AsyncIterator[pl.DataFrame]:
+        """
+        Yields one dataframe of erc20 transfers per hypersync page, in block order.
 
-        for tx in data_dict["tx_data"]:
-            tx_data.append(
-                {
-                    "tx_hash": tx.hash,
-                    "block_number": tx.block_number,
-                    "from": tx.from_,
-                    "to": tx.to,
-                }
-            )
+        Only a few pages are held in memory at a time, so memory stays flat regardless of the size
+        of the block range. Pages without any transfers are skipped.
+        """
+        async for page in self.iter_erc20_pages(start_block=start_block,
+                                                end_block=end_block,
+                                                concurrency=concurrency,
+                                                shard_size=shard_size):
+            batch = self.page_to_df(page)
+            if not batch.is_empty():
+                yield batch
+
+    def page_to_df(self, page: dict[str]) -> pl.DataFrame:
+        """
+        Joins the decoded erc20 transfers of a single page with the sender and recipient of their transaction.
 
+        Decoding and assembly are columnar, straight from the arrow tables of the page, and limited to the
+        columns of the plan. Addresses and hashes are raw bytes rather than hex strings.
+        """
+        # check if the page has any logs. If it doesn't, then pass
+        if page["log_data"].num_rows == 0:
+            return pl.DataFrame()
 
-        logs_df = pl.from_dicts(joined_logs)
-        tx_df = pl.from_dicts(tx_data)
+        # logs and transactions are matched on their integer (block_number, transaction_index) keys
+        transfers = self.plan.decode(page["log_data"], page["tx_data"])
 
-        # this join is an expensive operation memory wise
-        return logs_df.join(tx_df, on=["tx_hash", 'block_number'], how="left").rename({'body': 'value_transferred'})
+        # addresses and hashes stay binary, use decode.hex_view() to render them
+        with telemetry.timer("dataframe_seconds"):
+            return pl.from_arrow(transfers)
 
-    async def fetch_erc20s(self, start_block: int, end_block: int) -> dict[str]:
+    async def fetch_erc20s(self, start_block: int, end_block: int, concurrency: int = 1,
+                           shard_size: int = None) -> dict[str]:
         """
-            - TODO get latest block header from lance database and update
+            Fetches and accumulates every erc20 transfer between start_block and end_block.
+            The tables only hold the fields of the plan, see plan_fetch(), and block_data is empty unless
+            the plan requests block fields.
+
+            The block range is split into shards which are paginated concurrently, with at most
+            `concurrency` requests in flight at once. Results are reassembled in block order.
+            Everything is held in memory, use iter_erc20_pages() to process the range page by page.
+
+            concurrency is the maximum number of hypersync requests in flight. Defaults to 1, which
+            pages through the whole range sequentially.
+            shard_size is the number of blocks per shard. Defaults to splitting the range into
+            4 shards per concurrent request so slow shards don't hold up the rest.
 
             Returns:
-                dict: A dictionary containing the following keys:
+                dict: A dictionary of pyarrow tables containing the following keys:
                     {
                         "tx_data": tx_data,
-                        "decoded_log_data": decoded_log_data,
                         "log_data": log_data,
                         "block_data": block_data
                     }
             """
+        # DATA ORGANIZTION
+        data_dict = {
+            "tx_data": [],
+            "log_data": [],
+            "block_data": []
+        }
+
+        # pages are buffered without limit since everything is accumulated anyway
+        async for page in self.iter_erc20_pages(start_block=start_block,
+                                                end_block=end_block,
+                                                concurrency=concurrency,
+                                                shard_size=shard_size,
+                                                max_buffered_pages=0):
+            for key, tables in data_dict.items():
+                tables.append(page[key])
+
+        return {key: pa.concat_tables(tables) if tables else pa.table({})
+                for key, tables in data_dict.items()}
 
-        query = hypersync.Query(
+    async def iter_erc20_pages(self, start_block: int, end_block: int, concurrency: int = 1,
+                               shard_size: int = None, max_buffered_pages: int = 4) -> AsyncIterator[dict[str]]:
+        """
+        Yields the arrow hypersync pages between start_block and end_block in block order.
+
+        Shards are fetched by a sliding window of 2 * concurrency tasks, with at most `concurrency`
+        requests in flight. Each shard buffers up to max_buffered_pages pages ahead of the consumer
+        (0 means unbounded), so at most 2 * concurrency * max_buffered_pages pages are held in memory.
+
+        Each page is a dictionary of the pyarrow tables returned by hypersync and the [from_block, next_block)
+        range they cover:
+            {
+                "tx_data": tx_data,
+                "log_data": log_data,
+                "block_data": block_data,
+                "from_block": from_block,
+                "next_block": next_block
+            }
+        """
+        if concurrency < 1:
+            # no shard could ever acquire the semaphore, so the fetch would wait forever
+            raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+        shards = iter(self.shard_ranges(start_block, end_block, concurrency, shard_size))
+        semaphore = asyncio.Semaphore(concurrency)
+        # (task, page queue) of the shards being fetched, in block order
+        window = collections.deque()
+
+        def start_next_shard():
+            shard = next(shards, None)
+            if shard is None:
+                return
+            pages = asyncio.Queue(maxsize=max_buffered_pages)
+            task = asyncio.create_task(self._fetch_range(shard[0], shard[1], semaphore, pages))
+            window.append((task, pages))
+
+        print(f"""starting to run query from block {start_block} to block {
+              end_block}. {end_block - start_block} blocks to fetch.""")
+
+        for _ in range(concurrency * 2):
+            start_next_shard()
+
+        try:
+            while window:
+                task, pages = window[0]
+                page = await pages.get()
+                if isinstance(page, Exception):
+                    raise page
+                # None marks the end of the shard
+                if page is None:
+                    window.popleft()
+                    start_next_shard()
+                    continue
+                yield page
+        finally:
+            for task, _ in window:
+                task.cancel()
+
+    @staticmethod
+    def shard_ranges(start_block: int, end_block: int, concurrency: int = 1, shard_size: int = None) -> List[Tuple[int, int]]:
+        """
+        Splits [start_block, end_block) into contiguous (start, end) sub-ranges in block order.
+        """
+        total_blocks = end_block - start_block
+        if total_blocks <= 0:
+            return []
+        if shard_size is None:
+            shards_wanted = 1 if concurrency <= 1 else concurrency * 4
+            shard_size = -(-total_blocks // shards_wanted)
+        shard_size = max(1, shard_size)
+
+        return [(block, min(block + shard_size, end_block))
+                for block in range(start_block, end_block, shard_size)]
+
+    def erc20_query(self, start_block: int, end_block: int) -> hypersync.Query:
+        """
+        Builds the hypersync query for all erc20 transfers between start_block and end_block.
+        Only the fields the plan needs are requested.
+        """
+        return hypersync.Query(
             to_block=end_block,
             from_block=start_block,
             logs=[hypersync.LogSelection(
                 # We want All ERC20 transfers so no address filter and only a filter for the first topic
-                topics=[
-                    ["0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"]]
+                topics=[[self.plan.event.topic0]]
             )],
-            field_selection=hypersync.FieldSelection(
-                log=[el.value for el in LogField],
-                transaction=[TransactionField.BLOCK_NUMBER,
-                             TransactionField.TRANSACTION_INDEX,
-                             TransactionField.HASH,
-                             TransactionField.FROM,
-                             TransactionField.TO
-                             ],
-                block=[el.value for el in hypersync.BlockField]
-            )
+            field_selection=self.plan.field_selection()
         )
 
-        # DATA ORGANIZTION
-        tx_data = []
-        decoded_log_data = []
-        log_data = []
-        block_data = []
-
-        print(f"""starting to run query from block {start_block} to block {
-              end_block}. {end_block - start_block} blocks to fetch.""")
-        # While loop for pagination
-        while True:
-            res = await self.client.send_req(query)
-
-            # Determine the directory containing the current script
-            base_dir = os.path.dirname(__file__)
-
-            # Build the path to the JSON file
-            file_path = os.path.join(base_dir, 'abis', 'erc20.json')
-
-            # Now you can safely open the file with the path
-            with open(file_path, 'r') as json_file:
-                abi = json_file.read()
-
-            # Map of contract_address -> abi
-            abis = {}
-
-            for log in res.data.logs:
-                abis[log.address] = abi
-
-            # Create a decoder with our mapping
-            decoder = hypersync.Decoder(abis)
-
-            # Decode the log on a background thread so we don't block the event loop.
-            # Can also use decoder.decode_logs_sync if it is more convenient.
-            decoded_logs = await decoder.decode_logs(res.data.logs)
-
-            # Accumulate data from response
-            tx_data.extend(res.data.transactions)
-            decoded_log_data.extend(decoded_logs)
-            log_data.extend(res.data.logs)
-            block_data.extend(res.data.blocks)
-
-            # Check if the fetched data has reached the current archive height or next block.
-            if end_block == res.next_block:
-                # Exit the loop if the end of the period (or the blockchain's current height) is reached.
-                break
-
-            # Update the query to fetch the next set of data starting from the next block.
-            query.from_block = res.next_block
-            # Log progress. # archive_height is the newest height of the block
-            # print(f"archive height: {res.archive_height}")
-            # print(f"from block: {query.from_block}")
-            # print(f"up to block: {end_block}")
-
-        return {
-            "tx_data": tx_data,
-            "decoded_log_data": decoded_log_data,
-            "log_data": log_data,
-            "block_data": block_data
-        }
+    async def _fetch_range(self, start_block: int, end_block: int, semaphore: asyncio.Semaphore,
+                           pages: asyncio.Queue):
+        """
+        Paginates through a single shard and puts each arrow page on the pages queue, followed by None.
+        If a request fails, the exception is put on the queue instead so the consumer raises it in block order.
+        The semaphore is only held while a request is in flight.
+        """
+        query = self.erc20_query(start_block, end_block)
+
+        try:
+            # While loop for pagination
+            while True:
+                async with semaphore:
+                    with telemetry.timer("hypersync_request_seconds"):
+                        res = await self.client.send_req_arrow(query)
+                telemetry.count("hypersync_pages_total")
+
+                # Hand the page to the consumer. Blocks while the consumer is max_buffered_pages behind.
+                await pages.put({
+                    "tx_data": res.data.transactions,
+                    "log_data": res.data.logs,
+                    "block_data": res.data.blocks,
+                    "from_block": query.from_block,
+                    "next_block": min(res.next_block, end_block)
+                })
+
+                # Check if the fetched data has reached the end of the shard.
+                if res.next_block >= end_block:
+                    # Exit the loop if the end of the shard is reached.
+                    break
+
+                # Update the query to fetch the next set of data starting from the next block.
+                query.from_block = res.next_block
+        except Exception as e:
+            await pages.put(e)
+            return
+
+        await pages.put(None)
@@ -1,11 +1,88 @@
 import asyncio
-import datetime
+import functools
 import lancedb
+import os
 import polars as pl
+import pyarrow as pa
+import pyarrow.compute as pc
 import time
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Tuple, Union
+from degen_tracker import telemetry
+from degen_tracker.balances import WalletBalances
+from degen_tracker.chunking import AdaptiveChunker
+from degen_tracker.decode import address_keys, hex_view, to_bytes
 from degen_tracker.hypersync import Hypersync
+from degen_tracker.maintenance import LanceMaintenance, MaintenancePolicy
+from degen_tracker.memory import MemoryBudget, StagedChunk, record_batches
+from degen_tracker.manifest import SyncManifest, manifest_path
+from degen_tracker.pipeline import SyncPipeline
+
+# uint256 values are stored as exact 32 byte big endian words, see degen_tracker.uint256
+# addresses and hashes are stored as fixed size binary, see degen_tracker.decode.hex_view
+LOGS_SCHEMA = pa.schema([
+    ("block_number", pa.uint64()),
+    ("transaction_index", pa.uint64()),
+    ("tx_hash", pa.binary(32)),
+    ("token", pa.binary(20)),
+    ("transfer_from", pa.binary(20)),
+    ("transfer_to", pa.binary(20)),
+    ("value_transferred", pa.binary(32)),
+    ("from", pa.binary(20)),
+    ("to", pa.binary(20)),
+    # indexed lookup keys of the address columns, see degen_tracker.decode.address_keys
+    ("token_key", pa.int64()),
+    ("transfer_from_key", pa.int64()),
+    ("transfer_to_key", pa.int64()),
+])
+
+# address columns with an indexed lookup key column
+KEY_COLUMNS = {"token": "token_key", "transfer_from": "transfer_from_key", "transfer_to": "transfer_to_key"}
+# columns with a scalar (btree) index
+INDEXED_COLUMNS = ("block_number", *KEY_COLUMNS.values())
+
+
+def to_logs_table(data: Union[pl.DataFrame, pa.Table]) -> pa.Table:
+    """
+    Converts a batch from Hypersync.iter_erc20_batches(), as a dataframe or its arrow table, to the arrow
+    schema of the logs table.
+    """
+    table = data.to_arrow() if isinstance(data, pl.DataFrame) else data
+    for column, key_column in KEY_COLUMNS.items():
+        table = table.append_column(key_column, pa.array(address_keys(table[column]), pa.int64()))
+
+    return table.select(LOGS_SCHEMA.names).cast(LOGS_SCHEMA)
+
+
+def to_logs_reader(batches: Iterable[pa.RecordBatch]) -> pa.RecordBatchReader:
+    """
+    Converts record batches of Hypersync.iter_erc20_batches() dataframes to the logs table schema lazily,
+    one batch at a time as the reader is consumed.
+    """
+    return pa.RecordBatchReader.from_batches(LOGS_SCHEMA, (
+        converted for batch in batches if batch.num_rows > 0
+        for converted in to_logs_table(pa.Table.from_batches([batch])).to_batches()))
+
+
+def _in_ranges(block_numbers: pa.Array, ranges: List[Tuple[int, int]]) -> pa.Array:
+    # mask of the block numbers in any of the [start, end) ranges
+    return functools.reduce(pc.or_, [pc.and_(pc.greater_equal(block_numbers, start), pc.less(block_numbers, end))
+                                     for start, end in ranges])
+
+
+class _Counted:
+    """
+    Iterates record batches, counting their rows.
+    """
+    def __init__(self, batches: Iterable[pa.RecordBatch]):
+        self.batches = batches
+        self.rows = 0
+
+    def __iter__(self):
+        for batch in self.batches:
+            self.rows += batch.num_rows
+            yield batch
 
 
 @dataclass
@@ -13,6 +90,15 @@ class LanceDBLogs:
     # 1. connect to lancedb and initialize a lance table an initial query
     uri: str = "logs"
     db: lancedb.DBConnection = lancedb.connect(uri)
+    # thresholds for the background compaction, index optimization and version cleanup
+    maintenance_policy: MaintenancePolicy = field(default_factory=MaintenancePolicy)
+    # block ranges committed to the logs table, loaded from disk in __post_init__
+    manifest: SyncManifest = None
+    # maintain materialized wallet balances from every ingested batch, see WalletBalances
+    track_balances: bool = False
+    balances: WalletBalances = None
+    # hypersync client used by db_sync and resume
+    client: Hypersync = field(default_factory=Hypersync)
     logs_tbl = None
 
     def __post_init__(self):
@@ -29,7 +115,62 @@ class LanceDBLogs:
                     f"Table {self.uri} does not exist. Consider creating it if this is expected.")
                 self.logs_tbl = None
 
-    def db_sync(self, start_block: int, end_block: int = None, block_chunks=25000):
+        if self.logs_tbl is not None:
+            self.check_schema()
+        if self.manifest is None:
+            self.manifest = self.load_manifest()
+        if self.track_balances and self.balances is None:
+            self.balances = WalletBalances.load(os.path.join(self.uri, f"{self.uri}_balances"))
+        if self.balances is not None:
+            # ranges committed without balances, e.g. by a sync before they were tracked, whichever
+            # writer (db_sync, TailStore or LiveFollower) appends next
+            self.balances.catch_up(self.logs_tbl, self.manifest)
+
+    def check_schema(self):
+        """
+        Raises if the logs table was written with an older schema, e.g. hex string addresses and float
+        values, without the lookup key columns or with keys derived differently, see address_keys.
+        Such a table can't be appended to and has to be re-synced.
+        """
+        found = {f.name: f.type for f in self.logs_tbl.schema}
+        mismatches = [f"{f.name} is missing" if f.name not in found else f"{f.name} is {found[f.name]}, not {f.type}"
+                      for f in LOGS_SCHEMA if found.get(f.name) != f.type]
+        mismatches += [f"{name} is not part of the schema" for name in found if name not in LOGS_SCHEMA.names]
+        if not mismatches:
+            # keys are derived the same way for every row, so a single row tells how the table was keyed
+            sample = self.logs_tbl.to_lance().to_table(columns=[*KEY_COLUMNS, *KEY_COLUMNS.values()], limit=1)
+            mismatches = [f"{key_column} was derived differently from {column}"
+                          for column, key_column in KEY_COLUMNS.items()
+                          if sample.num_rows and sample[key_column][0].as_py() != address_keys(sample[column])[0]]
+        if mismatches:
+            raise ValueError(f"Table {self.uri} was written with an older schema and has to be re-synced: "
+                             f"{'; '.join(mismatches)}. Drop it with db.drop_table('{self.uri}') and remove its "
+                             f"state files under {self.uri}/, then run db_sync() again.")
+
+    def load_manifest(self) -> SyncManifest:
+        """
+        Loads the committed block ranges of the logs table.
+
+        Tables written before the manifest existed are assumed to hold one contiguous range, read once
+        from the table itself. Tables older than the current schema are rejected before, see check_schema().
+        """
+        path = manifest_path(self.uri)
+        manifest = SyncManifest.load(path)
+        if manifest is not None:
+            return manifest
+
+        manifest = SyncManifest(path=path)
+        if self.logs_tbl is not None and self.logs_tbl.count_rows() > 0:
+            block_numbers = self.logs_tbl.to_lance().to_table(columns=["block_number"])["block_number"]
+            min_max = pc.min_max(block_numbers)
+            manifest.commit(min_max["min"].as_py(), min_max["max"].as_py() + 1,
+                            rows=len(block_numbers))
+            manifest.save()
+
+        return manifest
+
+    def db_sync(self, start_block: int, end_block: int = None, block_chunks=25000, concurrency: int = 1,
+                maintenance: bool = True, chunker: AdaptiveChunker = None, memory_budget: MemoryBudget = None):
         """
         Initializes the database and syncs the logs table based on the specified sync range.
 
@@ -40,70 +181,268 @@ class LanceDBLogs:
         Example:
         - Use full_sync=True to sync the entire history.
         - Use full_sync=False to perform a quick initial sync of the last 5000 blocks.
+
+        concurrency is the number of hypersync requests kept in flight while fetching each chunk.
+        Raise it for large historical backfills, where sequential paging is bound by round-trip latency.
+
+        maintenance runs table compaction and cleanup on a background thread while syncing, driven by
+        maintenance_policy. Set it to False when another process maintains the table.
+
+        block_chunks is the size of the first chunk. Later chunks are sized by the chunker from the observed
+        rows and bytes per block, see AdaptiveChunker, and the last chunk covers the tail of the range.
+        Pass a chunker with min_blocks == max_blocks for fixed size chunks.
+
+        memory_budget keeps the sync within a resident memory limit: chunks, the first one included, are
+        sized from the budget, batches spill to disk under memory pressure and buffers are released after
+        every chunk. Use it for full historical syncs on a box with fixed memory, see MemoryBudget.
         """
-        client = Hypersync()
+        self.repair_db()
+        self.create_indexes()
+        if self.balances is not None:
+            self.balances.catch_up(self.logs_tbl, self.manifest)
+        if chunker is None:
+            chunker = memory_budget.chunker(initial_blocks=block_chunks) if memory_budget is not None \
+                else AdaptiveChunker(initial_blocks=block_chunks)
 
-        # block height is most recent block height if not specified
-        if end_block is None:
-            end_block: int = asyncio.run(client.get_block_height())
+        maintainer = LanceMaintenance(self.db, self.uri, self.maintenance_policy)
+        if maintenance:
+            maintainer.start()
+
+        try:
+            asyncio.run(self._sync_range(start_block=start_block, end_block=end_block,
+                                         chunker=chunker, concurrency=concurrency, budget=memory_budget))
+        finally:
+            maintainer.stop()
+            if self.balances is not None:
+                self.balances.save()
+
+    def last_synced_block(self) -> Optional[int]:
+        """
+        Returns the last block committed to the logs table, or None if nothing has been synced yet.
+        Read from the sync manifest, so it costs the same regardless of the table size.
+        """
+        self.manifest.reload()
+        return self.manifest.last_block
+
+    def resume(self, end_block: int = None, block_chunks: int = None, concurrency: int = 1,
+               maintenance: bool = True, memory_budget: MemoryBudget = None):
+        """
+        Resumes syncing right after the last committed block, up to end_block or the block head.
+
+        block_chunks defaults to the last chunk size of the previous sync.
+        """
+        last_block = self.last_synced_block()
+        if last_block is None:
+            raise ValueError(f"Table {self.uri} has not been synced yet, use db_sync() to start a sync.")
+        if block_chunks is None:
+            block_chunks = self.manifest.block_chunks or 25000
 
-        for block in range(start_block, end_block, block_chunks):
-            erc20_logs_df = None
-            if block + block_chunks > end_block:
-                print('break!')
-                break
+        self.db_sync(start_block=last_block + 1, end_block=end_block, block_chunks=block_chunks,
+                     concurrency=concurrency, maintenance=maintenance, memory_budget=memory_budget)
 
-            progress_percent = (block / end_block) * 100
-            print('progress: ', round(progress_percent, 3),
-                  '%', 'block ', block, "/", end_block)
-            erc20_logs_df = client.get_erc20_df(
-                start_block=block, end_block=block+block_chunks)
+    async def _sync_range(self, start_block: int, end_block: int, chunker: AdaptiveChunker, concurrency: int,
+                          budget: MemoryBudget = None):
+        """
+        Runs the range through a SyncPipeline, so pages are fetched while earlier chunks are decoded and
+        appended to the logs table.
+        """
+        client = self.client
 
-            print('rows being added:', erc20_logs_df.shape)
-            self.create_db(erc20_logs_df)
+        # block height is most recent block height if not specified
+        if end_block is None:
+            end_block: int = await client.get_block_height()
 
-            # update db based on chunked info
-            self.update_db(erc20_logs_df)
+        pipeline = SyncPipeline(client=client, write=self.append_db, chunker=chunker, concurrency=concurrency,
+                                budget=budget)
+        try:
+            await pipeline.run(start_block, end_block)
+        finally:
+            # the next resume() starts from the chunk size learned in this sync
+            with self.manifest.locked():
+                self.manifest.block_chunks = chunker.next_size()
+                self.manifest.save()
 
-    def create_db(self, df: pl.DataFrame):
+    def create_db(self) -> bool:
         """
-        Attempt to create initial lancedb if it doesn't exist.
+        Attempt to create an empty logs table if it doesn't exist.
+
+        If another writer created the table in the meantime, it is opened instead.
+
+        Returns:
+            bool: whether the table was created.
         """
         try:
             # Attempt to create the table if it doesn't exist
-            self.logs_tbl = self.db.create_table(
-                self.uri, data=df)
+            self.logs_tbl = self.db.create_table(self.uri, schema=LOGS_SCHEMA)
+            return True
         except OSError as e:
             # Check if the error message is about the dataset already existing
             if "Dataset already exists" in str(e):
-                pass
-                # Skip table creation because it already exists
-                # print("Table already exists, skipping creation.")
+                # Skip table creation because it already exists, and write to the existing table
+                self.logs_tbl = self.db.open_table(self.uri)
+                self.check_schema()
+                return False
             else:
                 # If the error is due to another reason, re-raise the exception
                 raise
 
-    def update_db(self, update_df: pl.DataFrame, merge_on: str = "block_number"):
+    def append_db(self, data: Union[pl.DataFrame, StagedChunk], start_block: int, end_block: int) -> int:
         """
-        `update_db` performs an "upsert" operation on the logs table.
+        Appends the batch of logs for [start_block, end_block) and commits the range to the manifest.
+
+        Appending is idempotent at block range granularity: blocks that are already committed are dropped
+        from the batch, so re-syncing a range never duplicates rows. The cost of a write is proportional to
+        the batch rather than to the table.
+
+        A StagedChunk from a SyncPipeline is streamed into lance one record batch at a time, converted to
+        the logs schema per batch, so a chunk spilled under a MemoryBudget is never held in memory as a
+        whole. With track_balances it is materialized once for the balances.
+
+        The manifest is locked from reading the committed ranges to saving the new one, so this also holds
+        across LanceDBLogs instances and processes writing to the same table.
+
+        Returns:
+            int: the number of rows appended.
         """
+        with self.manifest.locked():
+            gaps = self.manifest.uncommitted(start_block, end_block)
+            if not gaps:
+                return 0
+            if self.balances is not None and isinstance(data, StagedChunk):
+                data = data.to_df()
+
+            rows = 0
+            if not data.is_empty():
+                batches = record_batches(data)
+                if gaps != [(start_block, end_block)]:
+                    batches = (batch.filter(_in_ranges(batch["block_number"], gaps)) for batch in batches)
+                batches = _Counted(batches)
+                with telemetry.timer("lance_write_seconds"):
+                    created = self.logs_tbl is None and self.create_db()
+                    self.logs_tbl.add(to_logs_reader(batches))
+                    if created:
+                        self.create_indexes()
+                rows = batches.rows
 
-        # check if db exists. If it doesn't, then create it
-        self.create_db(update_df)
+            for start, end in gaps:
+                self.manifest.commit(start, end)
+            self.manifest.rows += rows
+            self.manifest.save()
 
-        self.logs_tbl.compact_files()
-        self.logs_tbl.to_lance().optimize.optimize_indices()
-        self.logs_tbl.cleanup_old_versions(datetime.timedelta(seconds=60))
+        # applied after the commit, a crash in between is recovered by WalletBalances.catch_up.
+        # The balances skip the blocks they already applied themselves.
+        if self.balances is not None:
+            self.balances.apply(data, [(start_block, end_block)])
+
+        return rows
+
+    def create_indexes(self):
+        """
+        Creates the scalar indexes of INDEXED_COLUMNS that don't exist yet.
+
+        Rows appended afterwards are scanned until LanceMaintenance optimizes the indexes, so lookups stay
+        correct in between and only get slower.
+        """
+        if self.logs_tbl is None:
+            return
+        indexed = {column for index in self.logs_tbl.to_lance().list_indices() for column in index["fields"]}
+        for column in INDEXED_COLUMNS:
+            if column not in indexed:
+                self.logs_tbl.create_scalar_index(column)
+
+    def wallet_history(self, address: Union[str, bytes], since_block: int = None,
+                       limit: int = None) -> pl.DataFrame:
+        """
+        Transfers sent or received by address, newest first.
+
+        Served from the transfer_from and transfer_to key indexes, so the cost depends on the number of
+        transfers of the wallet rather than on the table size. Target latency: p99 under 100 ms for a
+        wallet with up to 1k transfers, on a local table whose indexes are up to date (see
+        MaintenancePolicy.max_unindexed_rows).
+
+        Parameters:
+        - address: 0x prefixed hex or 20 bytes.
+        - since_block: only transfers from this block on.
+        - limit: only the newest `limit` transfers.
+        """
+        return self._lookup(address, ["transfer_from", "transfer_to"], since_block, None, limit)
+
+    def token_transfers(self, token: Union[str, bytes], start_block: int = None, end_block: int = None,
+                        limit: int = None) -> pl.DataFrame:
+        """
+        Transfers of a token in [start_block, end_block), newest first. Either bound is optional.
+
+        Served from the token key index, with the same latency target as wallet_history for up to 1k
+        transfers in range.
+        """
+        return self._lookup(token, ["token"], start_block, end_block, limit)
+
+    def _lookup(self, address: Union[str, bytes], columns, start_block: Optional[int],
+                end_block: Optional[int], limit: Optional[int]) -> pl.DataFrame:
+        address = to_bytes(address) if isinstance(address, str) else address
+        names = [name for name in LOGS_SCHEMA.names if name not in KEY_COLUMNS.values()]
+        if self.logs_tbl is None:
+            return hex_view(pl.from_arrow(LOGS_SCHEMA.empty_table().select(names)))
+
+        key = address_keys(pa.array([address], pa.binary(20)))[0]
+        predicates = ["(" + " OR ".join(f"{KEY_COLUMNS[column]} = {key}" for column in columns) + ")"]
+        if start_block is not None:
+            predicates.append(f"block_number >= {start_block}")
+        if end_block is not None:
+            predicates.append(f"block_number < {end_block}")
+
+        df = pl.from_arrow(self.logs_tbl.to_lance().to_table(columns=names, filter=" AND ".join(predicates)))
+        # keys can collide, so the candidate rows are matched on the full address
+        df = df.filter(pl.any_horizontal([pl.col(column) == address for column in columns])) \
+            .sort(by=["block_number", "transaction_index"], descending=True)
+        if limit is not None:
+            df = df.head(limit)
+
+        return hex_view(df)
+
+    def repair_db(self):
+        """
+        Deletes rows outside of the committed block ranges, left behind by a sync that stopped between
+        appending a batch and committing its range.
+
+        The table row count is read from metadata, so this only scans the table after such a crash.
+        If the count still differs afterwards, committed ranges hold duplicate or missing rows, which can't
+        be repaired in place, and a ValueError is raised instead of accepting the count.
+        """
+        if self.logs_tbl is None:
+            return
+        with self.manifest.locked():
+            if self.logs_tbl.count_rows() == self.manifest.rows:
+                return
+
+            print('removing rows outside of the committed block ranges')
+            self.logs_tbl.delete(f"NOT ({self.manifest.committed_predicate()})")
+            rows = self.logs_tbl.count_rows()
+            if rows != self.manifest.rows:
+                raise ValueError(f"Table {self.uri} has {rows} rows in its committed block ranges but "
+                                 f"{self.manifest.rows} were committed. Re-sync the table.")
+
+    def update_db(self, update_df: pl.DataFrame, merge_on: str = "block_number"):
+        """
+        `update_db` performs an "upsert" operation on the logs table.
+
+        Prefer append_db() for syncing, the upsert joins against the whole table on every write.
+        Compaction and version cleanup are not run here, see LanceMaintenance.
+        """
 
-        # Perform a "upsert" operation
-        self.logs_tbl.merge_insert(merge_on)   \
-            .when_not_matched_insert_all() \
-            .execute(update_df)
+        with self.manifest.locked():
+            # check if db exists. If it doesn't, then create it
+            created = self.logs_tbl is None and self.create_db()
 
-        # lance db cleanup
-        # make table fragments compact
-        # 1m target rows per file
+            # Perform a "upsert" operation
+            with telemetry.timer("lance_write_seconds"):
+                self.logs_tbl.merge_insert(merge_on)   \
+                    .when_not_matched_insert_all() \
+                    .execute(to_logs_table(update_df))
+            if created:
+                self.create_indexes()
 
-        self.logs_tbl.cleanup_old_versions(
-            older_than=datetime.timedelta(seconds=600), delete_unverified=True
-        )
+            if not update_df.is_empty():
+                self.manifest.commit(update_df["block_number"].min(), update_df["block_number"].max() + 1)
+                self.manifest.rows = self.logs_tbl.count_rows()
+                self.manifest.save()
@@ -0,0 +1,174 @@
+import datetime
+import lancedb
+import threading
+import time
+
+from dataclasses import dataclass, field
+from degen_tracker import telemetry
+from typing import List
+
+
+@dataclass
+class MaintenancePolicy:
+    """
+    Thresholds that trigger compaction, index optimization and version cleanup of a lance table.
+
+    Maintenance runs when any threshold is crossed, but never more often than min_interval.
+    """
+    # fragments beyond those of the table fully compacted to target_rows_per_fragment, so a large table
+    # doesn't count as fragmented just for its size
+    max_fragments: int = 64
+    # fragments with fewer rows than this count as small
+    small_fragment_rows: int = 100_000
+    max_small_fragment_ratio: float = 0.5
+    max_versions: int = 100
+    # rows appended since the scalar indexes were last optimized, which lookups have to scan
+    max_unindexed_rows: int = 250_000
+    # run at least this often while rows are being written, i.e. while there are small fragments other than
+    # the tail of the table, even if no other threshold is crossed
+    max_interval: datetime.timedelta = datetime.timedelta(minutes=10)
+    min_interval: datetime.timedelta = datetime.timedelta(seconds=30)
+    target_rows_per_fragment: int = 1_000_000
+    cleanup_older_than: datetime.timedelta = datetime.timedelta(minutes=10)
+
+
+@dataclass
+class TableStats:
+    fragments: int
+    small_fragments: int
+    versions: int
+    unindexed_rows: int = 0
+    rows: int = 0
+
+    @property
+    def small_fragment_ratio(self) -> float:
+        return self.small_fragments / self.fragments if self.fragments else 0.0
+
+    def excess_fragments(self, target_rows_per_fragment: int) -> int:
+        """
+        Fragments beyond the ceil(rows / target_rows_per_fragment) of the table once fully compacted.
+        """
+        compacted = max(1, -(-self.rows // target_rows_per_fragment))
+        return max(0, self.fragments - compacted)
+
+
+@dataclass
+class LanceMaintenance:
+    """
+    Background maintenance of a lance table, off the ingest path.
+
+    A daemon thread polls the table stats every poll_interval seconds and compacts files, optimizes
+    indices and cleans up old versions when the policy says so. Writers only append, so maintenance
+    never blocks a write.
+
+    Example:
+        with LanceMaintenance(db, "logs"):
+            ...  # write to the table
+    """
+    db: lancedb.DBConnection
+    table_name: str
+    policy: MaintenancePolicy = field(default_factory=MaintenancePolicy)
+    poll_interval: float = 5.0
+    last_run: float = field(default_factory=time.monotonic)
+    _stop: threading.Event = field(default_factory=threading.Event, repr=False)
+    _thread: threading.Thread = field(default=None, repr=False)
+
+    def stats(self) -> TableStats:
+        """
+        Reads fragment and version counts from the latest version of the table manifest.
+        """
+        dataset = self.db.open_table(self.table_name).to_lance()
+        fragment_rows = [fragment.count_rows() for fragment in dataset.get_fragments()]
+
+        return TableStats(
+            fragments=len(fragment_rows),
+            small_fragments=sum(rows < self.policy.small_fragment_rows for rows in fragment_rows),
+            versions=len(dataset.versions()),
+            rows=sum(fragment_rows),
+            unindexed_rows=max((dataset.stats.index_stats(index["name"])["num_unindexed_rows"]
+                                for index in dataset.list_indices()), default=0),
+        )
+
+    def due(self, stats: TableStats) -> List[str]:
+        """
+        Returns the reasons maintenance should run now, empty if it should not.
+        """
+        elapsed = time.monotonic() - self.last_run
+        if elapsed < self.policy.min_interval.total_seconds():
+            return []
+
+        reasons = []
+        excess_fragments = stats.excess_fragments(self.policy.target_rows_per_fragment)
+        if excess_fragments > self.policy.max_fragments:
+            reasons.append(f"{excess_fragments} fragments over compacted")
+        if stats.fragments > 1 and stats.small_fragment_ratio > self.policy.max_small_fragment_ratio:
+            reasons.append(f"{stats.small_fragment_ratio:.0%} small fragments")
+        if stats.versions > self.policy.max_versions:
+            reasons.append(f"{stats.versions} versions")
+        if stats.unindexed_rows > self.policy.max_unindexed_rows:
+            reasons.append(f"{stats.unindexed_rows} unindexed rows")
+        if stats.small_fragments > 1 and elapsed > self.policy.max_interval.total_seconds():
+            reasons.append(f"{round(elapsed)}s since last maintenance")
+
+        return reasons
+
+    def run_once(self, force: bool = False) -> bool:
+        """
+        Runs maintenance if it is due, or unconditionally if force is True. Returns whether it ran.
+        """
+        try:
+            reasons = ["forced"] if force else self.due(self.stats())
+        except FileNotFoundError:
+            # the table has not been created yet
+            return False
+        if not reasons:
+            return False
+
+        start = time.monotonic()
+        tbl = self.db.open_table(self.table_name)
+        # make table fragments compact
+        with telemetry.timer("lance_compaction_seconds"):
+            tbl.compact_files(target_rows_per_fragment=self.policy.target_rows_per_fragment)
+        tbl.to_lance().optimize.optimize_indices()
+        # unverified files may belong to a write that is still in flight, so they are left alone
+        tbl.cleanup_old_versions(older_than=self.policy.cleanup_older_than)
+        self.last_run = time.monotonic()
+        telemetry.observe("lance_maintenance_seconds", self.last_run - start)
+
+        print('maintenance:', ', '.join(reasons), '- took', round(self.last_run - start, 3), 's')
+        return True
+
+    def start(self):
+        """
+        Starts the background maintenance thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=f"lance-maintenance-{self.table_name}",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background maintenance thread, waiting for a run in progress to finish.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                # a failed run is retried on the next poll rather than killing the thread
+                print(f"maintenance of {self.table_name} failed: {e}")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,170 @@
+import contextlib
+import json
+import os
+
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # windows
+    fcntl = None
+    import msvcrt
+
+
+@contextlib.contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Holds an exclusive lock on the file at path across threads and processes, creating it if needed.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    # locks the first byte, LK_LOCK gives up after 10 seconds so keep trying
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def manifest_path(uri: str) -> str:
+    """
+    The sync manifest of the logs table at uri.
+    """
+    return os.path.join(uri, f"{uri}_manifest.json")
+
+
+@dataclass
+class BlockRanges:
+    """
+    Half open [start, end) block ranges and the rows they hold, kept sorted and coalesced, so blocks
+    processed contiguously are described by a single range no matter how many batches they came in.
+
+    Only held in memory, see SyncManifest for the ranges committed to a table.
+    """
+    ranges: List[Tuple[int, int]] = field(default_factory=list)
+    # rows held across all ranges
+    rows: int = 0
+
+    @property
+    def last_block(self) -> Optional[int]:
+        """
+        The last committed block, e.g. the watermark a sync resumes from.
+        """
+        return self.ranges[-1][1] - 1 if self.ranges else None
+
+    def commit(self, start_block: int, end_block: int, rows: int = 0):
+        """
+        Records [start_block, end_block) as committed and coalesces it with its neighbours.
+        """
+        if end_block > start_block:
+            merged = []
+            for start, end in sorted(self.ranges + [(start_block, end_block)]):
+                if merged and start <= merged[-1][1]:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+                else:
+                    merged.append((start, end))
+            self.ranges = merged
+        self.rows += rows
+
+    def uncommitted(self, start_block: int, end_block: int) -> List[Tuple[int, int]]:
+        """
+        Returns the parts of [start_block, end_block) that have not been committed yet.
+        """
+        gaps = []
+        block = start_block
+        for start, end in self.ranges:
+            if end <= block:
+                continue
+            if start >= end_block:
+                break
+            if start > block:
+                gaps.append((block, start))
+            block = max(block, end)
+        if block < end_block:
+            gaps.append((block, end_block))
+
+        return gaps
+
+    def committed_predicate(self, column: str = "block_number") -> str:
+        """
+        SQL predicate matching the rows inside the committed ranges.
+        """
+        if not self.ranges:
+            return "false"
+
+        return " OR ".join(f"({column} >= {start} AND {column} < {end})" for start, end in self.ranges)
+
+
+@dataclass
+class SyncManifest(BlockRanges):
+    """
+    The block ranges committed to a table, persisted as a small json file next to it, see manifest_path().
+
+    A batch is appended to the table first and its range committed here second, so rows outside of the
+    committed ranges belong to a write that never completed. The committed rows are compared with the
+    table row count to detect such writes. Call save() to persist commits.
+
+    Every instance holds its own copy of the ranges. Writers update the manifest inside locked(), which
+    reloads it from disk under a lock shared by every process, so commits of other writers are never
+    overwritten.
+    """
+    # the json file of the manifest, see manifest_path()
+    path: str = None
+    # chunk size of the last sync, reused when it is resumed
+    block_chunks: Optional[int] = None
+
+    @classmethod
+    def load(cls, path: str) -> Optional["SyncManifest"]:
+        """
+        Loads the manifest at path, or returns None if there is none yet.
+        """
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as json_file:
+            state = json.load(json_file)
+
+        return cls(path=path, ranges=[tuple(r) for r in state["ranges"]], rows=state["rows"],
+                   block_chunks=state.get("block_chunks"))
+
+    def reload(self):
+        """
+        Replaces this copy with the manifest on disk, if there is one.
+        """
+        saved = SyncManifest.load(self.path)
+        if saved is not None:
+            self.ranges, self.rows, self.block_chunks = saved.ranges, saved.rows, saved.block_chunks
+
+    @contextlib.contextmanager
+    def locked(self) -> Iterator["SyncManifest"]:
+        """
+        Holds an exclusive lock on the manifest across threads and processes, reloaded from disk once the
+        lock is taken. Read the ranges, write the table and save() inside the block, so no other writer
+        commits in between.
+        """
+        with file_lock(self.path + ".lock"):
+            self.reload()
+            yield self
+
+    def save(self):
+        """
+        Atomically replaces the manifest file, so a crash never leaves a half written manifest behind.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as json_file:
+            json.dump({"ranges": self.ranges, "rows": self.rows, "block_chunks": self.block_chunks},
+                      json_file)
+        os.replace(tmp_path, self.path)
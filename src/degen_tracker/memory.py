@@ -0,0 +1,205 @@
+import gc
+import os
+import polars as pl
+import pyarrow as pa
+import tempfile
+
+from dataclasses import dataclass, field
+from degen_tracker import telemetry
+from degen_tracker.chunking import AdaptiveChunker
+from typing import Iterator, List, Optional, Union
+
+
+def rss() -> int:
+    """
+    The resident memory of this process in bytes.
+    """
+    try:
+        with open("/proc/self/statm", 'r') as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # no procfs, fall back to the peak, which over-reports but never under-reports
+        return peak_rss()
+
+
+def peak_rss() -> int:
+    """
+    The peak resident memory of this process in bytes, 0 where it can't be read (windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@dataclass
+class MemoryBudget:
+    """
+    Keeps a sync within `limit` bytes of resident memory.
+
+    The budget bounds memory three ways:
+    - chunk sizing: chunks target chunk_fraction of the limit. Before any chunk was written, the
+      first one is sized for max_bytes_per_block, so a large block_chunks can't blow the budget on a
+      busy range. The pages in the pipeline queues come on top of the chunk.
+    - spilling: once the process is above spill_threshold of the limit, the batches staged for the
+      current chunk are moved to an arrow ipc file under spill_dir. They are memory mapped back one
+      record batch at a time when the chunk is written, see StagedChunk, so the kernel can page them
+      out instead of the process running out of memory.
+    - releasing: freed arrow buffers are returned to the OS after every chunk instead of staying
+      cached in the allocator.
+
+    Example:
+        logs.db_sync(start_block=0, memory_budget=MemoryBudget(limit=4 * 2 ** 30))
+    """
+    limit: int
+    spill_threshold: float = 0.7
+    chunk_fraction: float = 0.1
+    # defaults to the system temporary directory
+    spill_dir: Optional[str] = None
+    # bytes per block assumed for the first chunk, about the busiest blocks of mainnet erc20 activity
+    max_bytes_per_block: int = 2 ** 20
+
+    @property
+    def chunk_bytes(self) -> int:
+        return int(self.limit * self.chunk_fraction)
+
+    def under_pressure(self) -> bool:
+        return rss() > self.limit * self.spill_threshold
+
+    def chunker(self, initial_blocks: int = 2_500) -> AdaptiveChunker:
+        """
+        An AdaptiveChunker targeting chunks of chunk_bytes bytes, starting with at most initial_blocks blocks.
+        """
+        initial_blocks = min(initial_blocks, max(self.chunk_bytes // self.max_bytes_per_block, 1))
+        return AdaptiveChunker(initial_blocks=initial_blocks, target_bytes=self.chunk_bytes)
+
+    def release(self):
+        """
+        Returns freed memory to the OS.
+        """
+        gc.collect()
+        pa.default_memory_pool().release_unused()
+
+
+@dataclass
+class StagedBatches:
+    """
+    The batches of a chunk waiting to be written, spilled to an arrow ipc file when the budget is
+    under pressure. Without a budget they always stay in memory.
+    """
+    budget: Optional[MemoryBudget] = None
+    batches: List[pl.DataFrame] = field(default_factory=list)
+    spilled_rows: int = 0
+    _path: Optional[str] = field(default=None, repr=False)
+    _writer: Optional[pa.ipc.RecordBatchFileWriter] = field(default=None, repr=False)
+
+    def append(self, df: pl.DataFrame):
+        self.batches.append(df)
+        if self.budget is not None and self.budget.under_pressure():
+            self.spill()
+
+    def spill(self):
+        """
+        Moves the in-memory batches to the spill file.
+        """
+        if not self.batches:
+            return
+        if self._writer is None:
+            schema = self.batches[0].to_arrow().schema
+            fd, self._path = tempfile.mkstemp(prefix="degen_tracker_spill_", suffix=".arrow",
+                                              dir=self.budget.spill_dir)
+            os.close(fd)
+            self._writer = pa.ipc.new_file(self._path, schema)
+
+        rows = 0
+        for df in self.batches:
+            self._writer.write_table(df.to_arrow())
+            rows += len(df)
+        self.batches = []
+        self.spilled_rows += rows
+        self.budget.release()
+
+        telemetry.count("spilled_rows_total", rows)
+
+    def take(self) -> "StagedChunk":
+        """
+        Hands every staged batch over as a StagedChunk and empties the stage. The chunk owns the spill
+        file from then on.
+        """
+        if self._writer is not None:
+            print('memory pressure:', self.spilled_rows, 'rows of the chunk were spilled to disk')
+            self._writer.close()
+        chunk = StagedChunk(frames=self.batches, spill_path=self._path, spilled_rows=self.spilled_rows)
+
+        self.batches, self.spilled_rows, self._path, self._writer = [], 0, None, None
+        return chunk
+
+    def close(self):
+        """
+        Removes the spill file of batches that were never taken.
+        """
+        if self._writer is not None:
+            self._writer.close()
+            os.remove(self._path)
+        self.batches, self.spilled_rows, self._path, self._writer = [], 0, None, None
+
+
+@dataclass
+class StagedChunk:
+    """
+    The batches of a chunk taken from StagedBatches, in order: the spilled ones in the spill file,
+    followed by those kept in memory.
+
+    batches() streams them one arrow record batch at a time, memory mapping the spill file, so a spilled
+    chunk can be written without ever being held in memory as a whole. to_df() concatenates them for
+    writers that need a dataframe.
+    """
+    frames: List[pl.DataFrame] = field(default_factory=list)
+    spill_path: Optional[str] = None
+    spilled_rows: int = 0
+
+    def __len__(self) -> int:
+        return self.spilled_rows + sum(len(df) for df in self.frames)
+
+    def is_empty(self) -> bool:
+        return len(self) == 0
+
+    def estimated_size(self) -> int:
+        spilled = os.path.getsize(self.spill_path) if self.spill_path is not None else 0
+        return spilled + sum(df.estimated_size() for df in self.frames)
+
+    def batches(self) -> Iterator[pa.RecordBatch]:
+        if self.spill_path is not None:
+            # the batches keep the mapping alive, so they may outlive the file
+            with pa.memory_map(self.spill_path) as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    yield reader.get_batch(i)
+        for df in self.frames:
+            yield from df.to_arrow().to_batches()
+
+    def to_df(self) -> pl.DataFrame:
+        frames = list(self.frames)
+        if self.spill_path is not None:
+            with pa.memory_map(self.spill_path) as source:
+                spilled = pa.ipc.open_file(source).read_all()
+            frames.insert(0, pl.from_arrow(spilled, rechunk=False))
+        if not frames:
+            return pl.DataFrame()
+        return pl.concat(frames, rechunk=False)
+
+    def close(self):
+        """
+        Removes the spill file.
+        """
+        if self.spill_path is not None:
+            os.remove(self.spill_path)
+        self.frames, self.spill_path, self.spilled_rows = [], None, 0
+
+
+def record_batches(data: Union[pl.DataFrame, StagedChunk]) -> Iterator[pa.RecordBatch]:
+    """
+    The arrow record batches of a dataframe or a staged chunk, see StagedChunk.batches().
+    """
+    return data.batches() if isinstance(data, StagedChunk) else iter(data.to_arrow().to_batches())
@@ -1,11 +1,82 @@
+import os
 import polars as pl
 import lancedb
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from degen_tracker import uint256
+from degen_tracker.decode import hex_view
+from degen_tracker.manifest import BlockRanges, SyncManifest, manifest_path
+from degen_tracker.state import GenerationStore
+from typing import List, Optional, Tuple
+
+BLOCK_COUNTS_SCHEMA = {"block_number": pl.UInt64, "transfers_count": pl.UInt32}
+ADDRESS_COUNTS_SCHEMA = {"from": pl.Binary, "address_swap_count": pl.UInt32}
+
+
+@dataclass
+class MetricsState:
+    """
+    Aggregates folded so far and the block ranges they cover, persisted next to the logs table.
+
+    `folded` uses the same [start, end) range bookkeeping as the sync manifest, so rows of a range are
+    folded exactly once even when ranges are synced out of order.
+    """
+    path: str
+    folded: BlockRanges = field(default_factory=BlockRanges)
+    block_counts: pl.DataFrame = field(default_factory=lambda: pl.DataFrame(schema=BLOCK_COUNTS_SCHEMA))
+    address_counts: pl.DataFrame = field(default_factory=lambda: pl.DataFrame(schema=ADDRESS_COUNTS_SCHEMA))
+    # lance version of the logs table when the state was last refreshed
+    version: Optional[int] = None
+    generation: int = 0
+
+    @property
+    def store(self) -> GenerationStore:
+        return GenerationStore(path=self.path, names=("block_counts", "address_counts"))
+
+    @classmethod
+    def load(cls, path: str) -> "MetricsState":
+        """
+        Loads the state saved at path, or returns an empty state if there is none yet.
+        """
+        saved = cls(path=path).store.load()
+        if saved is None:
+            return cls(path=path)
+        state, frames = saved
+
+        return cls(path=path, folded=BlockRanges(ranges=[tuple(r) for r in state["ranges"]]),
+                   block_counts=frames["block_counts"], address_counts=frames["address_counts"],
+                   version=state["version"], generation=state["generation"])
+
+    def save(self):
+        """
+        Saves the aggregates and their ranges as a new generation, see GenerationStore.
+        """
+        self.generation = self.store.save(
+            self.generation, {"ranges": self.folded.ranges, "version": self.version},
+            {"block_counts": self.block_counts, "address_counts": self.address_counts})
 
 
 @dataclass
 class Metrics:
+    """
+    Incrementally maintained transfer metrics of the logs table.
+
+    Per block transfer counts and per address transfer counts are kept as state. A refresh only reads the
+    rows of block ranges committed to the sync manifest since the last refresh, and is skipped after a
+    small json read of the manifest when nothing new was committed, so its cost depends on the new data
+    rather than on the table size. The state is saved under state_path and picked up again on restart.
+
+    Rows rewritten in place with LanceDBLogs.update_db are not picked up, call reset() after an upsert.
+    """
+    uri: str = "logs"
+    state_path: str = None
+    state: MetricsState = None
+
+    def __post_init__(self):
+        if self.state_path is None:
+            self.state_path = os.path.join(self.uri, f"{self.uri}_metrics")
+        self.db: lancedb.DBConnection = lancedb.connect(self.uri)
+        self.state = MetricsState.load(self.state_path)
 
     def stream(self) -> pl.DataFrame:
         """
@@ -17,32 +88,191 @@ class Metrics:
             print(self.count_transfers())
             time.sleep(5)
 
-    def group_by_addresses(self) -> pl.DataFrame:
+    def committed_ranges(self) -> List[Tuple[int, int]]:
+        """
+        The block ranges committed to the sync manifest of the logs table, empty if there is none yet.
+        """
+        manifest = SyncManifest.load(manifest_path(self.uri))
+        return manifest.ranges if manifest is not None else []
+
+    def refresh(self) -> int:
+        """
+        Folds the rows of newly committed block ranges into the state and saves it.
+
+        Only committed ranges are read, so rows of a write still in flight (or left behind by a crash and
+        later removed by repair_db) are never counted. The manifest rather than the table version decides
+        what is new: a writer commits a range after adding its rows, so a refresh in between sees a new
+        version but not the range, which is folded in by the next refresh.
+
+        Instances sharing the state path fold under its lock, and pick up the state saved by another
+        instance first, so ranges are neither folded twice nor lost to a concurrent save.
+
+        Returns:
+            int: the number of rows folded in.
         """
-        Groups metrics by addresses.
+        if self.uri not in self.db.table_names():
+            # nothing has been synced yet
+            return 0
+        ranges = self.committed_ranges()
+        if not self._new_ranges(ranges):
+            return 0
+
+        store = self.state.store
+        with store.locked():
+            if store.saved_generation() not in (None, self.state.generation):
+                self.state = MetricsState.load(self.state_path)
+            new_ranges = self._new_ranges(ranges)
+            if not new_ranges:
+                return 0
+
+            # the rows of committed ranges were added before the commit, so the version read now has them all
+            version = self.db.open_table(self.uri).version
+            new_df = self.scan(["block_number", "from", "value_transferred"], ranges=new_ranges)
+            self._fold(new_df)
+            for start, end in new_ranges:
+                self.state.folded.commit(start, end)
+
+            self.state.version = version
+            self.state.save()
 
-        df is the df loaded from the lancedb database
+        return len(new_df)
+
+    def _new_ranges(self, ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        return [gap for start, end in ranges for gap in self.state.folded.uncommitted(start, end)]
+
+    def scan(self, columns: List[str], since_block: int = None, until_block: int = None,
+             ranges: List[Tuple[int, int]] = None, limit: int = None) -> pl.DataFrame:
         """
+        Reads columns of the logs table with the block filters pushed into the lance scanner, so only the
+        requested columns of the fragments in range are read.
 
-        uri: str = "logs"
-        self.db = lancedb.connect(uri)
-        db: lancedb.DBConnection = lancedb.connect(uri)
-        logs_tbl = db.open_table(uri)
+        Parameters:
+        - since_block, until_block: keep blocks in [since_block, until_block), either bound is optional.
+        - ranges: keep blocks in any of these [start, end) ranges.
+        - limit: read at most this many rows.
+        """
+        predicates = []
+        if since_block is not None:
+            predicates.append(f"block_number >= {since_block}")
+        if until_block is not None:
+            predicates.append(f"block_number < {until_block}")
+        if ranges is not None:
+            if not ranges:
+                return pl.DataFrame(schema={column: None for column in columns})
+            predicates.append("(" + " OR ".join(f"(block_number >= {start} AND block_number < {end})"
+                                                for start, end in ranges) + ")")
 
-        # convert dataset to table (full in memory)
-        table = logs_tbl.to_pandas()
-        pl_df = pl.from_pandas(table)
+        scanner = self.db.open_table(self.uri).to_lance().scanner(
+            columns=columns, filter=" AND ".join(predicates) or None, limit=limit)
 
-        return pl_df.sort(by='block_number', descending=True).filter(pl.col('value_transferred') != 0).group_by(
-            'from').agg(pl.len().alias('address_swap_count')).sort(by='address_swap_count', descending=True)
+        return pl.from_arrow(scanner.to_table())
 
-    def count_transfers(self) -> pl.DataFrame:
-        uri: str = "logs"
-        self.db = lancedb.connect(uri)
-        db: lancedb.DBConnection = lancedb.connect(uri)
-        logs_tbl = db.open_table(uri)
+    def _fold(self, new_df: pl.DataFrame):
+        if new_df.is_empty():
+            return
+        # new ranges never overlap folded ones, so their blocks are new and can simply be appended
+        block_counts = new_df.group_by('block_number').agg(pl.len().cast(pl.UInt32).alias('transfers_count'))
+        self.state.block_counts = pl.concat([self.state.block_counts, block_counts.cast(BLOCK_COUNTS_SCHEMA)])
+
+        address_counts = new_df.filter(pl.col('value_transferred') != uint256.ZERO) \
+            .group_by('from').agg(pl.len().cast(pl.UInt32).alias('address_swap_count'))
+        self.state.address_counts = pl.concat([self.state.address_counts,
+                                               address_counts.cast(ADDRESS_COUNTS_SCHEMA)]) \
+            .group_by('from').agg(pl.col('address_swap_count').sum())
+
+    def reset(self):
+        """
+        Drops the state, so the next refresh recomputes the metrics from the whole table.
+        """
+        self.state = MetricsState(path=self.state_path, generation=self.state.generation)
+
+    def group_by_addresses(self, since_block: int = None, limit: int = None) -> pl.DataFrame:
+        """
+        Number of transfers with a non zero value sent by each address, most active first.
+
+        Without since_block this is served from the incremental state. With since_block only the `from`
+        and `value_transferred` columns of blocks from since_block on are scanned, so a dashboard window
+        over the last hour doesn't read the rest of the history. limit keeps the most active addresses.
+        """
+        if since_block is None:
+            self.refresh()
+            address_counts = self.state.address_counts
+        elif self.uri not in self.db.table_names():
+            address_counts = pl.DataFrame(schema=ADDRESS_COUNTS_SCHEMA)
+        else:
+            # lance can't compare binary literals in a scan filter, so the value filter runs on the
+            # projected columns instead
+            address_counts = self.scan(["from", "value_transferred"], since_block=since_block) \
+                .filter(pl.col('value_transferred') != uint256.ZERO) \
+                .group_by('from').agg(pl.len().alias('address_swap_count'))
+
+        address_counts = address_counts.sort(by='address_swap_count', descending=True)
+        if limit is not None:
+            address_counts = address_counts.head(limit)
+
+        # the counts are grouped on the 20 byte addresses, only the result is rendered as hex
+        return hex_view(address_counts)
+
+    def count_transfers(self, since_block: int = None, limit: int = None) -> pl.DataFrame:
+        """
+        Number of transfers per block, newest block first.
+
+        since_block keeps blocks from since_block on, and limit keeps the newest `limit` blocks.
+        """
+        self.refresh()
+
+        block_counts = self.state.block_counts
+        if since_block is not None:
+            block_counts = block_counts.filter(pl.col('block_number') >= since_block)
+        block_counts = block_counts.sort(by='block_number', descending=True)
+
+        return block_counts.head(limit) if limit is not None else block_counts
+
+
+@dataclass
+class LiveMetrics:
+    """
+    Transfer counts of the logs table including the newest blocks, for the process writing the table.
+
+    Metrics only see blocks once they are committed to lance, which for a LiveFollower is after its
+    TailStore flushed them, i.e. at least finality_blocks later. LiveMetrics also counts the batches the
+    follower publishes, folded in with fold() as they arrive, so the newest block shows up about one poll
+    interval after it was produced. Counts of published blocks are dropped once Metrics folded them from
+    lance.
+
+    Example:
+        live = LiveMetrics(Metrics(uri=logs.uri))
+        batches = follower.subscribe()
+        while True:
+            live.fold((await next_batch(batches, task)).df)
+            print(live.count_transfers(limit=10))
+    """
+    metrics: Metrics = field(default_factory=Metrics)
+    # transfers per published block not yet folded by metrics
+    block_counts: pl.DataFrame = field(default_factory=lambda: pl.DataFrame(schema=BLOCK_COUNTS_SCHEMA))
+
+    def fold(self, df: pl.DataFrame):
+        """
+        Counts the rows of a published batch, e.g. TailBatch.df.
+        """
+        if df.is_empty():
+            return
+        block_counts = df.group_by('block_number').agg(pl.len().cast(pl.UInt32).alias('transfers_count'))
+        self.block_counts = pl.concat([self.block_counts, block_counts.cast(BLOCK_COUNTS_SCHEMA)])
+
+    def count_transfers(self, since_block: int = None, limit: int = None) -> pl.DataFrame:
+        """
+        Number of transfers per block, newest block first, see Metrics.count_transfers.
+        """
+        committed = self.metrics.count_transfers(since_block=since_block)
+        folded = self.metrics.state.folded.ranges
+        if folded and not self.block_counts.is_empty():
+            self.block_counts = self.block_counts.filter(~pl.any_horizontal(
+                [pl.col('block_number').is_between(start, end, closed="left") for start, end in folded]))
 
-        # convert dataset to table
-        pl_df = logs_tbl.to_polars()
+        block_counts = self.block_counts
+        if since_block is not None:
+            block_counts = block_counts.filter(pl.col('block_number') >= since_block)
+        block_counts = pl.concat([committed, block_counts]).sort(by='block_number', descending=True)
 
-        return pl_df.sort(by='block_number', descending=True).group_by('block_number').agg(pl.len().alias('transfers_count')).sort(by='block_number', descending=True).collect()
+        return block_counts.head(limit) if limit is not None else block_counts
@@ -0,0 +1,166 @@
+import lancedb
+import multiprocessing
+import os
+import queue
+import threading
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from degen_tracker import telemetry
+from degen_tracker.hypersync import Hypersync
+from degen_tracker.lance import LanceDBLogs
+from degen_tracker.maintenance import LanceMaintenance, MaintenancePolicy
+from degen_tracker.memory import MemoryBudget
+from degen_tracker.telemetry import QueueSink, Sink
+from typing import Dict, List, Optional
+
+
+@dataclass
+class ChainSpec:
+    """
+    A chain to sync: its name, hypersync endpoint and the block to start from.
+    """
+    chain: str
+    url: str
+    start_block: int = 0
+    # defaults to the block head at the start of the sync
+    end_block: Optional[int] = None
+    # client used instead of connecting to url, e.g. a degen_tracker.replay.ReplayClient offline.
+    # It is sent to the worker process, so it must be picklable.
+    client: object = None
+
+    @property
+    def uri(self) -> str:
+        """
+        The logs table of the chain, see LanceDBLogs.uri.
+        """
+        return f"logs_{self.chain}"
+
+
+def sync_chain(spec: ChainSpec, concurrency: int, memory_budget: Optional[MemoryBudget],
+               telemetry_queue=None) -> int:
+    """
+    Syncs one chain into its own logs table, resuming after the last committed block if the table was
+    synced before. Runs in a worker process of MultiChainSync. Returns the number of rows in the table.
+    """
+    if telemetry_queue is not None:
+        telemetry.enable(QueueSink(telemetry_queue, spec.chain))
+    try:
+        logs = LanceDBLogs(uri=spec.uri, db=lancedb.connect(spec.uri),
+                           client=Hypersync(url=spec.url, client=spec.client))
+        # the coordinator maintains every table, so the workers only write
+        if logs.last_synced_block() is None:
+            logs.db_sync(start_block=spec.start_block, end_block=spec.end_block, concurrency=concurrency,
+                         maintenance=False, memory_budget=memory_budget)
+        else:
+            logs.resume(end_block=spec.end_block, concurrency=concurrency, maintenance=False,
+                        memory_budget=memory_budget)
+        return logs.manifest.rows
+    finally:
+        telemetry.disable()
+
+
+@dataclass
+class MultiChainSync:
+    """
+    Syncs several chains at once, one worker process per chain, each into its own logs table.
+
+    The sync of a single chain is mostly bound by one core, decoding and writing, so chains scale across
+    cores when each gets its own process. The coordinator shares what would otherwise be duplicated per
+    chain:
+    - maintenance: one LanceMaintenance thread per table runs in the coordinator under a single policy,
+      while the workers only write.
+    - instrumentation: the workers forward their telemetry to the coordinator, which merges it into its
+      own registry and exports it through `sinks`, so every chain shows up on one endpoint.
+
+    Each chain's table is named after it, see ChainSpec.uri, and can be queried with e.g.
+    Metrics(uri="logs_base"). A chain that fails doesn't stop the others, its error is raised once they
+    are done.
+
+    Example:
+        MultiChainSync([
+            ChainSpec("base", "https://base.hypersync.xyz", start_block=2_000_000),
+            ChainSpec("optimism", "https://optimism.hypersync.xyz"),
+        ], sinks=[PrometheusSink(port=9464)]).run()
+    """
+    chains: List[ChainSpec]
+    # worker processes, defaults to one per chain up to the number of cores
+    processes: Optional[int] = None
+    # hypersync requests in flight per chain
+    concurrency: int = 4
+    # memory budget of each worker
+    memory_budget: Optional[MemoryBudget] = None
+    maintenance_policy: MaintenancePolicy = field(default_factory=MaintenancePolicy)
+    maintenance: bool = True
+    # telemetry sinks of the coordinator, the workers' metrics are forwarded to them
+    sinks: List[Sink] = field(default_factory=list)
+
+    def run(self) -> Dict[str, int]:
+        """
+        Syncs every chain and returns the number of rows in each chain's table.
+        """
+        names = [spec.chain for spec in self.chains]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Chains must be unique, got {names}")
+
+        maintainers = {spec.chain: LanceMaintenance(lancedb.connect(spec.uri), spec.uri, self.maintenance_policy)
+                       for spec in self.chains} if self.maintenance else {}
+        for maintainer in maintainers.values():
+            maintainer.start()
+
+        registry = telemetry.enable(*self.sinks) if self.sinks else None
+        # spawned workers, lance's runtime threads don't survive a fork
+        context = multiprocessing.get_context("spawn")
+        with context.Manager() as manager:
+            telemetry_queue = manager.Queue() if registry is not None else None
+            stop = threading.Event()
+            collector = threading.Thread(target=self._collect, args=(registry, telemetry_queue, stop),
+                                         name="multichain-telemetry", daemon=True)
+            if registry is not None:
+                collector.start()
+
+            rows, errors = {}, {}
+            try:
+                processes = self.processes or min(len(self.chains), os.cpu_count() or 1)
+                with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+                    futures = {pool.submit(sync_chain, spec, self.concurrency, self.memory_budget,
+                                           telemetry_queue): spec.chain
+                               for spec in self.chains}
+                    for future in as_completed(futures):
+                        chain = futures[future]
+                        try:
+                            rows[chain] = future.result()
+                            print(f'{chain}: synced, {rows[chain]} rows')
+                        except Exception as e:
+                            errors[chain] = e
+                            print(f'{chain}: sync failed: {e!r}')
+            finally:
+                stop.set()
+                if registry is not None:
+                    collector.join()
+                for maintainer in maintainers.values():
+                    maintainer.stop()
+                telemetry.disable()
+
+        # a failed chain may not have a table yet
+        for chain in rows:
+            if chain in maintainers:
+                maintainers[chain].run_once(force=True)
+
+        if errors:
+            raise RuntimeError(f"Sync failed for chains {sorted(errors)}") from next(iter(errors.values()))
+        return rows
+
+    @staticmethod
+    def _collect(registry: telemetry.Registry, telemetry_queue, stop: threading.Event):
+        # snapshots are cumulative per worker, so only the change since a chain's last snapshot is merged
+        latest = {}
+        while True:
+            try:
+                chain, snapshot = telemetry_queue.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    return
+                continue
+            registry.merge(snapshot, latest.get(chain))
+            latest[chain] = snapshot
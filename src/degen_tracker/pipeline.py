@@ -0,0 +1,127 @@
+import asyncio
+
+from dataclasses import dataclass, field
+from degen_tracker import telemetry
+from degen_tracker.chunking import AdaptiveChunker
+from degen_tracker.hypersync import Hypersync
+from degen_tracker.memory import MemoryBudget, StagedBatches, StagedChunk
+from typing import Callable, Optional
+
+# sentinel closing a stage's output queue
+DONE = None
+
+
+@dataclass
+class ChunkEnd:
+    """
+    Marks the end of a chunk's pages in the stage queues.
+    """
+    start_block: int
+    end_block: int
+
+
+@dataclass
+class SyncPipeline:
+    """
+    Syncs block ranges through three concurrent stages joined by bounded queues:
+
+        fetch (hypersync pages) -> decode (page_to_df) -> write (e.g. LanceDBLogs.append_db)
+
+    The network keeps fetching while batches are decoded and written, and a full queue pauses the stages
+    upstream of it, so memory is bounded by queue_size pages per queue plus the chunk being written.
+    Decoding and writing run in worker threads so they don't block the event loop the requests run on.
+    Each stage handles one item at a time, so batches are written in block order.
+
+    Block ranges are split into chunks by the chunker, and the pages of a chunk are written as one batch.
+    write is called with (chunk, start_block, end_block) for the [start_block, end_block) range of a chunk,
+    where chunk is a StagedChunk. Writers stream it with chunk.batches(), or call chunk.to_df().
+    The size of every written chunk is fed back to the chunker.
+
+    With a memory budget, the batches staged for a chunk spill to disk when the process is under memory
+    pressure, and freed buffers are released after every chunk, see MemoryBudget.
+    """
+    client: Hypersync
+    write: Callable[[StagedChunk, int, int], int]
+    chunker: AdaptiveChunker = field(default_factory=AdaptiveChunker)
+    concurrency: int = 1
+    queue_size: int = 4
+    budget: Optional[MemoryBudget] = None
+
+    async def run(self, start_block: int, end_block: int):
+        """
+        Fetches, decodes and writes [start_block, end_block) chunk by chunk, in order.
+        """
+        pages = asyncio.Queue(maxsize=self.queue_size)
+        batches = asyncio.Queue(maxsize=self.queue_size)
+
+        stages = [
+            asyncio.create_task(self._fetch(start_block, end_block, pages)),
+            asyncio.create_task(self._decode(pages, batches)),
+            asyncio.create_task(self._write(batches)),
+        ]
+
+        # a failed stage would leave the others waiting on their queues forever, so cancel them
+        done, pending = await asyncio.wait(stages, return_when=asyncio.FIRST_EXCEPTION)
+        for task in pending:
+            task.cancel()
+        # the writer only ends once its chunk in flight is written, so a retry resumes after it
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task in done:
+            task.result()
+
+    async def _fetch(self, start_block: int, end_block: int, pages: asyncio.Queue):
+        # chunks are sized lazily, so each one uses the densities observed by the writer so far
+        for start, end in self.chunker.chunks(start_block, end_block):
+            progress_percent = (start / end_block) * 100
+            print('progress: ', round(progress_percent, 3),
+                  '%', 'block ', start, "/", end_block, '- chunk of', end - start, 'blocks')
+
+            chunk_pages = 0
+            async for page in self.client.iter_erc20_pages(start_block=start, end_block=end,
+                                                           concurrency=self.concurrency):
+                await pages.put(page)
+                chunk_pages += 1
+            telemetry.observe("pages_per_chunk", chunk_pages)
+            await pages.put(ChunkEnd(start, end))
+
+        await pages.put(DONE)
+
+    async def _decode(self, pages: asyncio.Queue, batches: asyncio.Queue):
+        while (page := await pages.get()) is not DONE:
+            if isinstance(page, ChunkEnd):
+                await batches.put(page)
+                continue
+            df = await asyncio.to_thread(self.client.page_to_df, page)
+            if not df.is_empty():
+                await batches.put(df)
+
+        await batches.put(DONE)
+
+    async def _write(self, batches: asyncio.Queue):
+        chunk = StagedBatches(self.budget)
+        try:
+            while (batch := await batches.get()) is not DONE:
+                if not isinstance(batch, ChunkEnd):
+                    chunk.append(batch)
+                    continue
+
+                staged = chunk.take()
+                rows, nbytes = len(staged), staged.estimated_size()
+                print('rows being added:', rows)
+                write = asyncio.ensure_future(asyncio.to_thread(self.write, staged, batch.start_block,
+                                                                batch.end_block))
+                try:
+                    await asyncio.shield(write)
+                except asyncio.CancelledError:
+                    # the thread can't be interrupted, so wait for the chunk to be written
+                    await write
+                    raise
+                finally:
+                    staged.close()
+                if self.budget is not None:
+                    self.budget.release()
+                self.chunker.observe(batch.end_block - batch.start_block, rows, nbytes)
+                telemetry.count("rows_total", rows)
+                telemetry.count("bytes_total", nbytes)
+        finally:
+            chunk.close()
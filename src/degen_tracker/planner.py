@@ -0,0 +1,103 @@
+import hypersync
+import pyarrow as pa
+
+from dataclasses import dataclass
+from degen_tracker import telemetry
+from degen_tracker.decode import TRANSFER, EventSpec, assemble_transfers, default_registry
+from typing import Sequence, Tuple, Union
+
+# output columns read from the transaction of each log
+TRANSACTION_COLUMNS = ("from", "to")
+# fields matching logs with their transaction, see assemble_transfers
+JOIN_FIELDS = ("block_number", "transaction_index")
+
+
+def _ordered(fields: set, order: Sequence[str]) -> Tuple[str, ...]:
+    # hypersync field enum order, so equal plans build equal queries
+    return tuple(name for name in order if name in fields)
+
+
+@dataclass(frozen=True)
+class FetchPlan:
+    """
+    What to request from hypersync and how to decode it, for a given set of output columns.
+
+    Built by plan_fetch(). Hypersync only sends the fields of field_selection(), so a plan cuts bandwidth,
+    server work and arrow deserialization on every page as well as decoding work.
+    """
+    event: EventSpec
+    # output columns, in order
+    columns: Tuple[str, ...]
+    # columns decoded from the logs, including the join keys when transactions are needed
+    log_columns: Tuple[str, ...]
+    transaction_columns: Tuple[str, ...]
+    log_fields: Tuple[str, ...]
+    transaction_fields: Tuple[str, ...]
+    block_fields: Tuple[str, ...]
+
+    def field_selection(self) -> hypersync.FieldSelection:
+        return hypersync.FieldSelection(log=list(self.log_fields),
+                                        transaction=list(self.transaction_fields),
+                                        block=list(self.block_fields))
+
+    def decode(self, logs: pa.Table, transactions: pa.Table) -> pa.Table:
+        """
+        Decodes the logs of a page and joins them with their transactions if the output needs them.
+
+        Returns:
+            pa.Table: the plan's columns, in order.
+        """
+        with telemetry.timer("decode_seconds"):
+            table = self.event.decode(logs, self.log_columns)
+        if self.transaction_columns:
+            with telemetry.timer("join_seconds"):
+                table = assemble_transfers(table, transactions, self.transaction_columns)
+
+        return table.select(list(self.columns))
+
+
+def plan_fetch(schema: Union[pa.Schema, Sequence[str]] = None,
+               event: Union[str, EventSpec] = TRANSFER.signature) -> FetchPlan:
+    """
+    Derives the minimal hypersync field selection and decoding for the columns of schema, which may be a
+    pyarrow schema or a list of column names. Defaults to every column, which is what the logs table stores.
+
+    event is the signature of an event of the default registry, see default_registry(), or an EventSpec.
+
+    Output columns are the columns decoded from the event, see EventSpec.log_fields, and the `from` and
+    `to` of its transaction unless the event has columns of the same name. Transactions are only requested
+    when one of those is asked for. No output column comes from blocks, so block fields are never requested.
+
+    Example:
+        # token volume only needs the emitting address and the value, and no transactions
+        client = Hypersync(plan=plan_fetch(["block_number", "token", "value_transferred"]))
+    """
+    if isinstance(event, str):
+        event = default_registry().get(event)
+    from_transactions = tuple(column for column in TRANSACTION_COLUMNS if column not in event.log_fields)
+    available = (*event.log_fields, *from_transactions)
+    columns = available if schema is None else tuple(schema.names if isinstance(schema, pa.Schema) else schema)
+    unknown = [column for column in columns if column not in available]
+    if unknown:
+        raise ValueError(f"Columns {unknown} can't be fetched, the available columns are {list(available)}")
+    if not columns:
+        raise ValueError("At least one column is needed")
+
+    transaction_columns = tuple(column for column in columns if column in from_transactions)
+    log_columns = {column for column in columns if column in event.log_fields}
+    transaction_fields = set()
+    if transaction_columns:
+        log_columns.update(JOIN_FIELDS)
+        transaction_fields.update(JOIN_FIELDS, transaction_columns)
+
+    log_fields = set(EventSpec.MATCH_FIELDS) | {event.log_fields[column] for column in log_columns}
+
+    return FetchPlan(
+        event=event,
+        columns=columns,
+        log_columns=_ordered(log_columns, event.log_fields),
+        transaction_columns=transaction_columns,
+        log_fields=_ordered(log_fields, [field.value for field in hypersync.LogField]),
+        transaction_fields=_ordered(transaction_fields, [field.value for field in hypersync.TransactionField]),
+        block_fields=(),
+    )
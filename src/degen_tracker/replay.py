@@ -0,0 +1,227 @@
+import asyncio
+import numpy as np
+import os
+import pyarrow as pa
+import random
+import time
+
+from dataclasses import dataclass, field
+from degen_tracker.decode import TRANSFER, fixed_size_binary, to_bytes
+from degen_tracker.hypersync import Hypersync
+from typing import List, Optional, Tuple
+
+# logs, transactions and blocks tables of a block range, as returned by hypersync
+Tables = Tuple[pa.Table, pa.Table, pa.Table]
+
+
+def mix(values: np.ndarray) -> np.ndarray:
+    """
+    splitmix64 finalizer, a fast vectorized hash of uint64 values.
+    """
+    values = values.astype(np.uint64)
+    values ^= values >> np.uint64(30)
+    values *= np.uint64(0xbf58476d1ce4e5b9)
+    values ^= values >> np.uint64(27)
+    values *= np.uint64(0x94d049bb133111eb)
+    values ^= values >> np.uint64(31)
+    return values
+
+
+def _words(ids: np.ndarray, width: int, salt: int) -> np.ndarray:
+    # (rows, width) byte matrix derived from ids, distinct ids give distinct words
+    parts = [mix(ids * np.uint64(8) + np.uint64(salt * 1000 + i)).astype('>u8') for i in range(-(-width // 8))]
+    return np.stack(parts, axis=1).view(np.uint8).reshape(len(ids), -1)[:, :width]
+
+
+def _binary(matrix: np.ndarray) -> pa.Array:
+    # hypersync returns variable size binary columns
+    return fixed_size_binary(matrix).cast(pa.binary())
+
+
+@dataclass
+class SyntheticSource:
+    """
+    Deterministic synthetic erc20 transfers, transfers_per_block per block between `wallets` wallets
+    over `tokens` tokens.
+
+    Every row is a function of its block number and position, so a block looks the same no matter how
+    the requests are paged or sharded, and benchmark runs are comparable.
+    """
+    height: int = 1_000_000
+    transfers_per_block: int = 50
+    wallets: int = 100_000
+    tokens: int = 1_000
+    seed: int = 0
+
+    def tables(self, from_block: int, to_block: int) -> Tables:
+        blocks = np.arange(from_block, to_block, dtype=np.uint64)
+        block_number = np.repeat(blocks, self.transfers_per_block)
+        transaction_index = np.tile(np.arange(self.transfers_per_block, dtype=np.uint64), len(blocks))
+        ids = block_number * np.uint64(self.transfers_per_block) + transaction_index + np.uint64(self.seed << 40)
+
+        sender = mix(ids) % np.uint64(self.wallets)
+        recipient = mix(ids + np.uint64(1 << 62)) % np.uint64(self.wallets)
+        token = mix(ids ^ np.uint64(0x5555)) % np.uint64(self.tokens)
+        value = mix(ids ^ np.uint64(0xaaaa)) >> np.uint64(8)
+
+        tx_hash = _binary(_words(ids, 32, 1))
+        topic = np.zeros((len(ids), 32), dtype=np.uint8)
+        topic[:, 12:] = _words(sender, 20, 2)
+        topic1 = _binary(topic)
+        topic[:, 12:] = _words(recipient, 20, 2)
+        topic2 = _binary(topic)
+        data = np.zeros((len(ids), 32), dtype=np.uint8)
+        data[:, 24:] = value.astype('>u8').view(np.uint8).reshape(-1, 8)
+        address = _binary(_words(token, 20, 3))
+
+        logs = pa.table({
+            "removed": pa.array(np.zeros(len(ids), dtype=bool)),
+            "log_index": pa.array(transaction_index),
+            "transaction_index": pa.array(transaction_index),
+            "transaction_hash": tx_hash,
+            "block_hash": _binary(_words(block_number, 32, 4)),
+            "block_number": pa.array(block_number),
+            "address": address,
+            "data": _binary(data),
+            "topic0": pa.array([to_bytes(TRANSFER.topic0)] * len(ids), pa.binary()),
+            "topic1": topic1,
+            "topic2": topic2,
+            "topic3": pa.nulls(len(ids), pa.binary()),
+        })
+        transactions = pa.table({
+            "block_number": pa.array(block_number),
+            "transaction_index": pa.array(transaction_index),
+            "hash": tx_hash,
+            "from": _binary(_words(sender, 20, 2)),
+            "to": address,
+        })
+        block_table = pa.table({
+            "number": pa.array(blocks),
+            "hash": _binary(_words(blocks, 32, 4)),
+            "timestamp": pa.array(blocks * np.uint64(2)),
+        })
+
+        return logs, transactions, block_table
+
+
+@dataclass
+class RecordedSource:
+    """
+    Pages recorded from hypersync with record(), replayed from arrow ipc files.
+    """
+    logs: pa.Table
+    transactions: pa.Table
+    blocks: pa.Table
+    height: int
+
+    @classmethod
+    def load(cls, path: str) -> "RecordedSource":
+        tables = {}
+        for name in ("logs", "transactions", "blocks"):
+            with pa.memory_map(os.path.join(path, f"{name}.arrow")) as source:
+                tables[name] = pa.ipc.open_file(source).read_all()
+        with open(os.path.join(path, "height"), 'r') as height_file:
+            height = int(height_file.read())
+
+        return cls(height=height, **tables)
+
+    def tables(self, from_block: int, to_block: int) -> Tables:
+        return (self._slice(self.logs, "block_number", from_block, to_block),
+                self._slice(self.transactions, "block_number", from_block, to_block),
+                self._slice(self.blocks, "number", from_block, to_block))
+
+    @staticmethod
+    def _slice(table: pa.Table, column: str, from_block: int, to_block: int) -> pa.Table:
+        if table.num_rows == 0:
+            return table
+        # recorded tables are in block order
+        blocks = table[column].to_numpy()
+        start, end = np.searchsorted(blocks, [from_block, to_block], side="left")
+        return table.slice(start, end - start)
+
+
+async def record(path: str, start_block: int, end_block: int, client: Hypersync = None, concurrency: int = 4):
+    """
+    Records the erc20 pages of [start_block, end_block) from hypersync to arrow ipc files under path,
+    for RecordedSource.
+    """
+    client = client or Hypersync()
+    data = await client.fetch_erc20s(start_block, end_block, concurrency=concurrency)
+
+    os.makedirs(path, exist_ok=True)
+    for name, key in (("logs", "log_data"), ("transactions", "tx_data"), ("blocks", "block_data")):
+        table = data[key]
+        with pa.OSFile(os.path.join(path, f"{name}.arrow"), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    with open(os.path.join(path, "height"), 'w') as height_file:
+        height_file.write(str(end_block))
+
+
+def _select(table: pa.Table, fields: Optional[List]) -> pa.Table:
+    # fields may be hypersync field enums or their string values
+    names = [getattr(name, "value", name) for name in fields or []]
+    if not names:
+        return pa.table({})
+    return table.select([name for name in names if name in table.column_names])
+
+
+@dataclass
+class ReplayData:
+    logs: pa.Table
+    transactions: pa.Table
+    blocks: pa.Table
+
+
+@dataclass
+class ReplayResponse:
+    next_block: int
+    archive_height: int
+    data: ReplayData
+
+
+@dataclass
+class ReplayClient:
+    """
+    Offline stand-in for hypersync.HypersyncClient, serving pages of a SyntheticSource or RecordedSource.
+
+    Implements the part of the client the package uses, get_height() and send_req_arrow(). Each request
+    waits latency seconds plus up to jitter seconds, and returns at most blocks_per_page blocks, like a
+    hypersync page cut short by its time or size limit. Only the fields in the field selection of the
+    query are returned.
+
+    Example:
+        client = Hypersync(client=ReplayClient(SyntheticSource(), latency=0.05))
+    """
+    source: object = field(default_factory=SyntheticSource)
+    latency: float = 0.0
+    jitter: float = 0.0
+    blocks_per_page: int = 1_000
+    requests: int = 0
+    # seconds taken by each send_req_arrow call
+    latencies: List[float] = field(default_factory=list)
+    _random: random.Random = field(default_factory=lambda: random.Random(0), repr=False)
+
+    async def get_height(self) -> int:
+        await self._wait()
+        return self.source.height
+
+    async def send_req_arrow(self, query) -> ReplayResponse:
+        start = time.perf_counter()
+        await self._wait()
+        self.requests += 1
+        to_block = query.to_block if query.to_block is not None else self.source.height
+        next_block = min(query.from_block + self.blocks_per_page, to_block, self.source.height)
+        logs, transactions, blocks = self.source.tables(query.from_block, next_block)
+        selection = query.field_selection
+        self.latencies.append(time.perf_counter() - start)
+
+        return ReplayResponse(next_block=next_block, archive_height=self.source.height,
+                              data=ReplayData(logs=_select(logs, selection.log),
+                                              transactions=_select(transactions, selection.transaction),
+                                              blocks=_select(blocks, selection.block)))
+
+    async def _wait(self):
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
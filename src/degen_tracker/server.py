@@ -0,0 +1,162 @@
+import asyncio
+import json
+import tornado.web
+import tornado.websocket
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from degen_tracker.metrics import Metrics
+from typing import Dict, Optional, Set, Tuple
+
+# metrics served by name, each called with since_block and limit
+METRICS = {
+    "count_transfers": Metrics.count_transfers,
+    "group_by_addresses": Metrics.group_by_addresses,
+}
+
+
+@dataclass
+class MetricsServer:
+    """
+    Serves Metrics over HTTP and WebSocket.
+
+        GET /metrics/<name>?since_block=&limit=   the metric as a json list of rows
+        WS  /ws/<name>?since_block=&limit=        the metric, pushed again whenever it changes
+
+    Responses are cached per metric and parameters, and the cache is invalidated when the lance version of
+    the logs table or its committed block ranges change, so any number of clients cost one computation per
+    metric and table state. Metrics only count committed ranges, and a writer commits a range after adding
+    its rows, so the version alone would miss the commit that follows it.
+    Metrics are computed on a single worker thread, which keeps the event loop responsive and the
+    incremental Metrics state single threaded.
+
+    Example:
+        asyncio.run(MetricsServer().serve())
+    """
+    metrics: Metrics = field(default_factory=Metrics)
+    port: int = 8888
+    # seconds between checks of the table state
+    poll_interval: float = 1.0
+    # the table state the cache was computed at, see table_state()
+    state: Optional[tuple] = None
+    # table state polls and websocket pushes that failed
+    errors: int = 0
+    _cache: Dict[Tuple[str, Optional[int], Optional[int]], asyncio.Future] = field(default_factory=dict, repr=False)
+    _sockets: Set["MetricsSocket"] = field(default_factory=set, repr=False)
+    _executor: ThreadPoolExecutor = field(default_factory=lambda: ThreadPoolExecutor(max_workers=1), repr=False)
+
+    def table_state(self) -> Optional[tuple]:
+        """
+        The current lance version of the logs table and its committed block ranges, None if it doesn't
+        exist yet.
+        """
+        if self.metrics.uri not in self.metrics.db.table_names():
+            return None
+        version = self.metrics.db.open_table(self.metrics.uri).version
+        return version, tuple(self.metrics.committed_ranges())
+
+    async def get(self, name: str, since_block: int = None, limit: int = None) -> str:
+        """
+        The metric as json, computed at most once per table state.
+        """
+        if name not in METRICS:
+            raise KeyError(name)
+        key = (name, since_block, limit)
+        # concurrent requests for the same key share one computation
+        if key not in self._cache:
+            loop = asyncio.get_running_loop()
+            self._cache[key] = loop.run_in_executor(self._executor, self._compute, name, since_block, limit)
+        try:
+            return await asyncio.shield(self._cache[key])
+        except Exception:
+            self._cache.pop(key, None)
+            raise
+
+    def _compute(self, name: str, since_block: Optional[int], limit: Optional[int]) -> str:
+        df = METRICS[name](self.metrics, since_block=since_block, limit=limit)
+        return json.dumps(df.to_dicts())
+
+    async def watch(self):
+        """
+        Invalidates the cache and pushes updates to the websocket clients when the table state changes.
+
+        A failed poll or push is logged and counted in errors, and the server carries on: the poll is
+        retried after poll_interval, and the other clients are still updated.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                state = await loop.run_in_executor(self._executor, self.table_state)
+            except Exception as e:
+                self.errors += 1
+                print(f'metrics server: reading the table state failed with {e!r}')
+                state = self.state
+            if state != self.state:
+                self.state = state
+                self._cache.clear()
+                for socket in list(self._sockets):
+                    try:
+                        await socket.push()
+                    except Exception as e:
+                        self.errors += 1
+                        print(f'metrics server: pushing {socket.name} failed with {e!r}')
+            await asyncio.sleep(self.poll_interval)
+
+    def app(self) -> tornado.web.Application:
+        return tornado.web.Application([
+            (r"/metrics/(\w+)", MetricsHandler, dict(server=self)),
+            (r"/ws/(\w+)", MetricsSocket, dict(server=self)),
+        ])
+
+    async def serve(self):
+        """
+        Serves until cancelled.
+        """
+        self.app().listen(self.port)
+        print(f"serving metrics on http://localhost:{self.port}/metrics/count_transfers")
+        await self.watch()
+
+
+def _int_argument(handler: tornado.web.RequestHandler, name: str) -> Optional[int]:
+    value = handler.get_query_argument(name, None)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        raise tornado.web.HTTPError(400, f"{name} must be an integer")
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def initialize(self, server: MetricsServer):
+        self.server = server
+
+    async def get(self, name: str):
+        if name not in METRICS:
+            raise tornado.web.HTTPError(404, f"unknown metric {name}")
+        body = await self.server.get(name, _int_argument(self, "since_block"), _int_argument(self, "limit"))
+        self.set_header("Content-Type", "application/json")
+        self.write(body)
+
+
+class MetricsSocket(tornado.websocket.WebSocketHandler):
+    def initialize(self, server: MetricsServer):
+        self.server = server
+
+    async def open(self, name: str):
+        if name not in METRICS:
+            self.close(code=1008, reason=f"unknown metric {name}")
+            return
+        self.name = name
+        self.since_block = _int_argument(self, "since_block")
+        self.limit = _int_argument(self, "limit")
+        self.server._sockets.add(self)
+        await self.push()
+
+    async def push(self):
+        body = await self.server.get(self.name, self.since_block, self.limit)
+        try:
+            await self.write_message(body)
+        except tornado.websocket.WebSocketClosedError:
+            self.server._sockets.discard(self)
+
+    def on_close(self):
+        self.server._sockets.discard(self)
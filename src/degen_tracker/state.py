@@ -0,0 +1,86 @@
+import contextlib
+import json
+import os
+import polars as pl
+
+from dataclasses import dataclass
+from degen_tracker.manifest import file_lock
+from typing import Dict, Iterator, Optional, Tuple
+
+
+@dataclass
+class GenerationStore:
+    """
+    Dataframes derived from the logs table and the json state describing them, e.g. the block ranges
+    they cover, persisted in the directory at path.
+
+    Every save writes the dataframes as parquet files of a new generation and then atomically points
+    state.json at that generation, so a crash leaves the previous state intact rather than dataframes
+    that don't match their state. Used by Metrics and WalletBalances.
+
+    Instances sharing a path update it inside locked(), after checking saved_generation() for saves of
+    other instances, so no save is overwritten with state that misses it.
+    """
+    path: str
+    # names of the dataframes saved in every generation
+    names: Tuple[str, ...]
+
+    @property
+    def state_file(self) -> str:
+        return os.path.join(self.path, "state.json")
+
+    def load(self) -> Optional[Tuple[dict, Dict[str, pl.DataFrame]]]:
+        """
+        The saved state, including its generation, and the dataframes of that generation, or None if
+        nothing has been saved yet.
+        """
+        if not os.path.exists(self.state_file):
+            return None
+        with open(self.state_file, 'r') as json_file:
+            state = json.load(json_file)
+
+        return state, {name: pl.read_parquet(self._file(name, state["generation"])) for name in self.names}
+
+    def saved_generation(self) -> Optional[int]:
+        """
+        The generation saved last, or None if nothing has been saved yet. Only reads state.json.
+        """
+        if not os.path.exists(self.state_file):
+            return None
+        with open(self.state_file, 'r') as json_file:
+            return json.load(json_file)["generation"]
+
+    @contextlib.contextmanager
+    def locked(self) -> Iterator["GenerationStore"]:
+        """
+        Holds an exclusive lock on the store across threads and processes.
+        """
+        with file_lock(os.path.join(self.path, "state.lock")):
+            yield self
+
+    def save(self, generation: int, state: dict, frames: Dict[str, pl.DataFrame]) -> int:
+        """
+        Saves state and frames as the generation after `generation` and removes the files of `generation`.
+
+        Returns:
+            int: the new generation.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        new_generation = generation + 1
+        for name in self.names:
+            frames[name].write_parquet(self._file(name, new_generation))
+
+        tmp_path = self.state_file + ".tmp"
+        with open(tmp_path, 'w') as json_file:
+            json.dump({**state, "generation": new_generation}, json_file)
+        os.replace(tmp_path, self.state_file)
+
+        for name in self.names:
+            old_file = self._file(name, generation)
+            if os.path.exists(old_file):
+                os.remove(old_file)
+
+        return new_generation
+
+    def _file(self, name: str, generation: int) -> str:
+        return os.path.join(self.path, f"{name}-{generation}.parquet")
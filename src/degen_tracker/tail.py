@@ -0,0 +1,164 @@
+import asyncio
+import polars as pl
+
+from dataclasses import dataclass, field
+from degen_tracker.chunking import AdaptiveChunker
+from degen_tracker.hypersync import Hypersync
+from degen_tracker.lance import KEY_COLUMNS, LOGS_SCHEMA, LanceDBLogs
+from degen_tracker.memory import StagedChunk
+from degen_tracker.pipeline import SyncPipeline
+from typing import List, Optional, Union
+
+
+@dataclass
+class TailStore:
+    """
+    Hot tier for the newest blocks: an in memory buffer in front of the logs table.
+
+    Tailing the chain writes a few blocks at a time, which would leave lance with a fragment per write.
+    Instead new blocks are kept in memory, where recent() serves them without touching lance, and blocks
+    that are at least finality_blocks behind the newest one are flushed to the logs table once
+    flush_rows of them, or max_buffered_blocks of them on a quiet chain, have accumulated.
+
+    Buffered blocks are not committed to the sync manifest until they are flushed, so after a restart
+    they are synced again rather than lost.
+
+    Example:
+        tail = TailStore(LanceDBLogs())
+        while True:
+            tail.sync()
+            print(tail.recent(since_block=tail.last_block() - 100))
+            time.sleep(2)
+    """
+    logs: LanceDBLogs
+    # blocks this far behind the newest buffered block are final and may be flushed
+    finality_blocks: int = 64
+    flush_rows: int = 250_000
+    # flush final blocks after this many even below flush_rows, so blocks of a quiet chain are committed
+    # (and survive a restart) within about half an hour of 2s blocks
+    max_buffered_blocks: int = 900
+    # defaults to the client of the logs table
+    client: Hypersync = None
+    # chunk sizes for tail syncs, a chunk is usually the few blocks produced since the last sync
+    chunker: AdaptiveChunker = field(default_factory=lambda: AdaptiveChunker(initial_blocks=500))
+    # buffered rows of the blocks in [start_block, end_block), in block order
+    buffer: pl.DataFrame = None
+    start_block: Optional[int] = None
+    end_block: Optional[int] = None
+
+    def __post_init__(self):
+        if self.client is None:
+            self.client = self.logs.client
+        if self.start_block is None:
+            last_block = self.logs.last_synced_block()
+            self.start_block = last_block + 1 if last_block is not None else None
+        self.end_block = self.start_block
+
+    def last_block(self) -> Optional[int]:
+        """
+        The newest block held by either tier.
+        """
+        return self.end_block - 1 if self.end_block is not None else self.logs.last_synced_block()
+
+    def append(self, df: Union[pl.DataFrame, StagedChunk], start_block: int, end_block: int):
+        """
+        Buffers the rows of [start_block, end_block), which must follow the buffered blocks, and flushes
+        the final blocks to lance once enough rows or blocks have accumulated. Same signature as LanceDBLogs.append_db,
+        so a TailStore can be the write stage of a SyncPipeline.
+        """
+        if self.end_block is None:
+            self.start_block = self.end_block = start_block
+        if start_block != self.end_block:
+            raise ValueError(f"Blocks {start_block} to {end_block} don't follow the tail ending at {self.end_block}")
+
+        if isinstance(df, StagedChunk):
+            df = df.to_df()
+
+        if not df.is_empty():
+            self.buffer = df if self.buffer is None else pl.concat([self.buffer, df], rechunk=False)
+        self.end_block = end_block
+
+        if self._final_rows() >= self.flush_rows or self._final_blocks() >= self.max_buffered_blocks:
+            self.flush()
+
+    def flush(self, force: bool = False) -> int:
+        """
+        Writes the final buffered blocks to the logs table as one batch, or every buffered block if force
+        is True (e.g. before shutting down).
+
+        Returns:
+            int: the number of rows written.
+        """
+        if self.end_block is None:
+            return 0
+        flush_end = self.end_block if force else max(self.start_block, self.end_block - self.finality_blocks)
+        if flush_end == self.start_block:
+            return 0
+
+        split = self._offset(flush_end)
+        final = self.buffer.slice(0, split) if self.buffer is not None else pl.DataFrame()
+        rows = self.logs.append_db(final.rechunk(), self.start_block, flush_end)
+
+        if self.buffer is not None:
+            self.buffer = self.buffer.slice(split)
+        self.start_block = flush_end
+
+        return rows
+
+    def recent(self, since_block: int = None, columns: List[str] = None) -> pl.DataFrame:
+        """
+        Rows from since_block on, served from memory for buffered blocks. Older blocks are read from the
+        logs table, see Metrics.scan for a scan of lance only.
+        """
+        if self.buffer is None:
+            hot = pl.DataFrame()
+        else:
+            hot = self.buffer.slice(self._offset(since_block)) if since_block is not None else self.buffer
+            if columns is not None:
+                hot = hot.select(columns)
+        if since_block is None or self.start_block is None or since_block >= self.start_block:
+            return hot
+        if self.logs.logs_tbl is None:
+            # nothing has been flushed to the logs table yet
+            return hot
+
+        names = columns or [name for name in LOGS_SCHEMA.names if name not in KEY_COLUMNS.values()]
+        cold = pl.from_arrow(self.logs.logs_tbl.to_lance().to_table(
+            columns=names, filter=f"block_number >= {since_block} AND block_number < {self.start_block}"))
+        # lance doesn't return filtered rows in block order
+        order = [name for name in ("block_number", "transaction_index") if name in names]
+        if order:
+            cold = cold.sort(by=order)
+
+        return pl.concat([cold, hot]) if not hot.is_empty() else cold
+
+    def sync(self, end_block: int = None, concurrency: int = 1):
+        """
+        Fetches the blocks after the tail up to end_block or the block head into the buffer.
+        """
+        start_block = self.last_block() + 1 if self.last_block() is not None else 0
+        asyncio.run(self._sync(start_block, end_block, concurrency))
+
+    async def _sync(self, start_block: int, end_block: Optional[int], concurrency: int):
+        if end_block is None:
+            end_block = await self.client.get_block_height()
+        if end_block <= start_block:
+            return
+
+        pipeline = SyncPipeline(client=self.client, write=self.append, chunker=self.chunker,
+                                concurrency=concurrency)
+        await pipeline.run(start_block, end_block)
+
+    def _final_rows(self) -> int:
+        if self.buffer is None:
+            return 0
+        return self._offset(self.end_block - self.finality_blocks)
+
+    def _final_blocks(self) -> int:
+        return max(self.end_block - self.finality_blocks - self.start_block, 0)
+
+    def _offset(self, block: int) -> int:
+        # rows are buffered in block order, so the first row of a block is found by binary search
+        if self.buffer is None:
+            return 0
+        return int(self.buffer["block_number"].search_sorted(block, side="left"))
@@ -0,0 +1,284 @@
+"""
+Counters and timing histograms of the sync hot path, exported through pluggable sinks.
+
+Telemetry is off by default and every call is then a single check of a module global, so the
+instrumented code pays next to nothing. Turn it on with enable():
+
+    telemetry.enable(PrometheusSink(port=9464), JsonLinesSink("sync_metrics.jsonl"))
+    LanceDBLogs().db_sync(...)
+    telemetry.disable()
+
+Metrics recorded by the package:
+    hypersync_request_seconds   latency of a hypersync request
+    hypersync_pages_total       pages fetched
+    pages_per_chunk             pages fetched per sync chunk
+    decode_seconds              decoding the logs of a page
+    join_seconds                joining decoded logs with their transactions
+    dataframe_seconds           building the polars dataframe of a page
+    lance_write_seconds         appending or upserting a batch
+    lance_compaction_seconds    compacting the table fragments
+    lance_maintenance_seconds   compaction, index optimization and cleanup
+    rows_total, bytes_total     rows and estimated bytes written
+    spilled_rows_total          rows spilled to disk under memory pressure, see MemoryBudget
+"""
+import bisect
+import contextlib
+import json
+import threading
+import time
+
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+# histograms that don't measure seconds
+BUCKETS = {"pages_per_chunk": COUNT_BUCKETS}
+PREFIX = "degen_tracker_"
+
+
+@dataclass
+class Histogram:
+    buckets: Tuple[float, ...]
+    # observations per bucket, the last one counts those above every bucket
+    counts: List[int] = None
+    sum: float = 0.0
+    count: int = 0
+
+    def __post_init__(self):
+        if self.counts is None:
+            self.counts = [0] * (len(self.buckets) + 1)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+@dataclass
+class Registry:
+    counters: Dict[str, float] = field(default_factory=dict)
+    histograms: Dict[str, Histogram] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(BUCKETS.get(name, SECONDS_BUCKETS))
+            histogram.observe(value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "time": time.time(),
+                "counters": dict(self.counters),
+                "histograms": {name: {"count": h.count, "sum": h.sum, "buckets": list(h.buckets),
+                                      "counts": list(h.counts)}
+                               for name, h in self.histograms.items()},
+            }
+
+    def merge(self, snapshot: dict, previous: dict = None):
+        """
+        Adds the metrics of a snapshot from another registry, less those of its previous snapshot, so
+        cumulative snapshots of other processes can be merged as they arrive.
+        """
+        previous = previous or {"counters": {}, "histograms": {}}
+        with self._lock:
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value - previous["counters"].get(name, 0)
+            for name, h in snapshot["histograms"].items():
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    histogram = self.histograms[name] = Histogram(tuple(h["buckets"]))
+                before = previous["histograms"].get(name, {"count": 0, "sum": 0.0, "counts": [0] * len(h["counts"])})
+                histogram.counts = [total + count - old
+                                    for total, count, old in zip(histogram.counts, h["counts"], before["counts"])]
+                histogram.sum += h["sum"] - before["sum"]
+                histogram.count += h["count"] - before["count"]
+
+    def prometheus(self) -> str:
+        """
+        The metrics in the prometheus text exposition format.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            lines += [f"# TYPE {PREFIX}{name} counter", f"{PREFIX}{name} {value}"]
+        for name, h in sorted(snapshot["histograms"].items()):
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            cumulative = 0
+            for bound, count in zip(h["buckets"], h["counts"]):
+                cumulative += count
+                lines.append(f'{PREFIX}{name}_bucket{{le="{bound}"}} {cumulative}')
+            lines += [f'{PREFIX}{name}_bucket{{le="+Inf"}} {h["count"]}',
+                      f"{PREFIX}{name}_sum {h['sum']}", f"{PREFIX}{name}_count {h['count']}"]
+
+        return "\n".join(lines) + "\n"
+
+
+class Sink:
+    """
+    Exports a registry, started by enable() and stopped by disable().
+    """
+    def start(self, registry: Registry):
+        pass
+
+    def stop(self):
+        pass
+
+
+class PeriodicSink(Sink):
+    """
+    Exports every interval seconds on a background thread, and once more when stopped.
+    """
+    interval: float
+
+    def start(self, registry: Registry):
+        self._registry = registry
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=f"telemetry-{type(self).__name__}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.export(self._registry.snapshot())
+
+    def export(self, snapshot: dict):
+        raise NotImplementedError
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.export(self._registry.snapshot())
+
+
+@dataclass
+class JsonLinesSink(PeriodicSink):
+    """
+    Appends a snapshot of every metric to a json lines file.
+    """
+    path: str
+    interval: float = 10.0
+
+    def export(self, snapshot: dict):
+        with open(self.path, 'a') as jsonl_file:
+            jsonl_file.write(json.dumps(snapshot) + "\n")
+
+
+@dataclass
+class QueueSink(PeriodicSink):
+    """
+    Puts (source, snapshot) on a multiprocessing queue. Forwards the metrics of a worker process to a
+    parent process, which merges them with Registry.merge().
+    """
+    queue: object
+    source: str
+    interval: float = 5.0
+
+    def export(self, snapshot: dict):
+        self.queue.put((self.source, snapshot))
+
+
+@dataclass
+class PrometheusSink(Sink):
+    """
+    Serves the metrics at http://<host>:<port>/metrics in the prometheus text format.
+    """
+    port: int = 9464
+    host: str = "0.0.0.0"
+    _server: ThreadingHTTPServer = field(default=None, repr=False)
+
+    def start(self, registry: Registry):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="telemetry-prometheus", daemon=True).start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+# the active registry, None while telemetry is disabled
+_registry: Optional[Registry] = None
+_sinks: List[Sink] = []
+_NULL_TIMER = contextlib.nullcontext()
+
+
+def enable(*sinks: Sink) -> Registry:
+    """
+    Starts recording, exported through sinks. Calling it again replaces the registry and sinks.
+    """
+    global _registry, _sinks
+    disable()
+    registry = Registry()
+    for sink in sinks:
+        sink.start(registry)
+    _registry, _sinks = registry, list(sinks)
+    return registry
+
+
+def disable():
+    """
+    Stops recording, and stops the sinks after their last export.
+    """
+    global _registry, _sinks
+    for sink in _sinks:
+        sink.stop()
+    _registry, _sinks = None, []
+
+
+def registry() -> Optional[Registry]:
+    return _registry
+
+
+def count(name: str, value: float = 1):
+    if _registry is not None:
+        _registry.count(name, value)
+
+
+def observe(name: str, value: float):
+    if _registry is not None:
+        _registry.observe(name, value)
+
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start)
+
+
+def timer(name: str):
+    """
+    Context manager observing the seconds spent in its block into the histogram `name`.
+    """
+    return _NULL_TIMER if _registry is None else _Timer(name)
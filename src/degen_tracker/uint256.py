@@ -0,0 +1,124 @@
+import numpy as np
+import polars as pl
+import pyarrow as pa
+from degen_tracker.decode import binary_matrix, fixed_size_binary
+from typing import List, Union
+
+# uint256 values, such as Transfer.value_transferred, are stored as exact 32 byte big endian words.
+# Helpers split them into 8 32-bit limbs held in uint64, so up to 2**32 values can be summed per limb
+# with vectorized integer sums and no overflow, before the carries are propagated.
+
+LIMBS = 8
+LIMB_BITS = 32
+LIMB_MASK = (1 << LIMB_BITS) - 1
+ZERO = bytes(32)
+
+Values = Union[pl.Series, pa.Array, pa.ChunkedArray]
+
+
+def limbs(values: Values) -> np.ndarray:
+    """
+    Splits uint256 words into a (rows, 8) uint64 matrix of 32-bit limbs, most significant limb first.
+    """
+    return np.ascontiguousarray(binary_matrix(values, 32)).view('>u4').astype(np.uint64)
+
+
+def normalize(totals: np.ndarray) -> np.ndarray:
+    """
+    Propagates the carries of a (rows, 8) matrix of summed limbs so every limb fits in 32 bits.
+    Anything carried out of the most significant limb wraps around, as in uint256 arithmetic.
+    """
+    totals = np.array(totals, dtype=np.uint64, order="C")
+    for i in range(LIMBS - 1, 0, -1):
+        totals[:, i - 1] += totals[:, i] >> np.uint64(LIMB_BITS)
+        totals[:, i] &= np.uint64(LIMB_MASK)
+    totals[:, 0] &= np.uint64(LIMB_MASK)
+
+    return totals
+
+
+def from_limbs(totals: np.ndarray) -> pa.FixedSizeBinaryArray:
+    """
+    Packs a (rows, 8) limb matrix back into 32 byte big endian uint256 words.
+    """
+    words = normalize(totals).astype('>u4').view(np.uint8).reshape(len(totals), 32)
+
+    return fixed_size_binary(words)
+
+
+def negate(values: Values) -> pa.FixedSizeBinaryArray:
+    """
+    Two's complement of uint256 words, so that adding it subtracts the value modulo 2**256.
+    """
+    inverted = np.uint64(LIMB_MASK) - limbs(values)
+    inverted[:, -1] += np.uint64(1)
+
+    return from_limbs(inverted)
+
+
+def to_int(word: bytes) -> int:
+    """
+    Converts a single uint256 word to a python int, for point lookups and display.
+    """
+    return int.from_bytes(word, "big")
+
+
+def from_ints(values: List[int]) -> pa.FixedSizeBinaryArray:
+    """
+    Encodes python ints as uint256 words.
+    """
+    return pa.array([value.to_bytes(32, "big") for value in values], pa.binary(32))
+
+
+def sum_uint256(values: Values) -> int:
+    """
+    Exact sum of a column of uint256 words.
+    """
+    totals = limbs(values).sum(axis=0, dtype=np.uint64)
+
+    return sum(int(total) << (LIMB_BITS * (LIMBS - 1 - i)) for i, total in enumerate(totals))
+
+
+def group_sum_uint256(df: pl.DataFrame, by: Union[str, List[str]], column: str) -> pl.DataFrame:
+    """
+    Exact group by sum of a uint256 column, e.g. token volume per token.
+
+    The limbs are summed by polars and the carries propagated with numpy, so no python int is created
+    per row or per group. The sums wrap around at 2**256.
+
+    Returns:
+        pl.DataFrame: the group by columns and `column` as the summed uint256 words.
+    """
+    limb_names = [f"{column}_limb{i}" for i in range(LIMBS)]
+    limb_df = pl.from_numpy(limbs(df[column]), schema=limb_names, orient="row")
+
+    summed = pl.concat([df.drop(column), limb_df], how="horizontal") \
+        .group_by(by).agg([pl.col(name).sum() for name in limb_names])
+
+    totals = summed.select(limb_names).to_numpy().astype(np.uint64)
+
+    return summed.drop(limb_names).with_columns(pl.from_arrow(from_limbs(totals)).alias(column))
+
+
+def to_decimal(values: Values, decimals: int = 0) -> pa.Array:
+    """
+    Reinterprets uint256 words as exact decimal256 values scaled by the token decimals.
+
+    Arrow stores decimal256 as a little endian 256-bit integer, so this is a byte reversal rather than a
+    conversion. Values of 10**76 and above exceed decimal256 precision, so this is meant for token
+    amounts rather than arbitrary words.
+    """
+    words = binary_matrix(values, 32)
+    little_endian = np.ascontiguousarray(words[:, ::-1])
+
+    return pa.Array.from_buffers(pa.decimal256(76, decimals), len(words), [None, pa.py_buffer(little_endian)])
+
+
+def to_float(values: Values, decimals: int = 0) -> np.ndarray:
+    """
+    Lossy float64 view of uint256 words scaled by the token decimals, for charts and display.
+    """
+    words = np.ascontiguousarray(binary_matrix(values, 32)).view('>u8').astype(np.float64)
+    floats = ((words[:, 0] * 2.0 ** 64 + words[:, 1]) * 2.0 ** 64 + words[:, 2]) * 2.0 ** 64 + words[:, 3]
+
+    return floats / 10.0 ** decimals
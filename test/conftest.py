@@ -0,0 +1,29 @@
+import lancedb
+import pytest
+
+from degen_tracker.hypersync import Hypersync
+from degen_tracker.lance import LanceDBLogs
+from degen_tracker.replay import ReplayClient, SyntheticSource
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # tables and their state files are created relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def source() -> SyntheticSource:
+    # few wallets and tokens, so balances and address counts aggregate many transfers
+    return SyntheticSource(height=2_000, transfers_per_block=5, wallets=50, tokens=5)
+
+
+@pytest.fixture
+def client(source) -> Hypersync:
+    return Hypersync(client=ReplayClient(source, blocks_per_page=100))
+
+
+@pytest.fixture
+def logs(client) -> LanceDBLogs:
+    return LanceDBLogs(db=lancedb.connect("logs"), client=client)
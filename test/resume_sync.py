@@ -1,38 +1,19 @@
-import duckdb
-import polars as pl
-import lancedb
 import time
 
 from degen_tracker.lance import LanceDBLogs
 
-pl.Config.set_fmt_str_lengths(200)
-pl.Config.set_fmt_float("full")
+# Resumes sync based on the last committed block number. Useful for if the database gets out of sync. Requires an existing logs database to work.
 
-# Resumes sync based on latest block number. Useful for if the database gets out of sync. Requires an existing logs database to work.
-
-
-# Attempt to connect to the database and open the table
-try:
-    # Open lancedb table
-    uri: str = "logs"
-    db: lancedb.DBConnection = lancedb.connect(uri)
-    logs_tbl = db.open_table("logs")
-except Exception as e:
-    print(f"Failed to connect to the database or open the table: {e}")
-    # Exit the script or handle the error as needed
-    raise SystemExit(e)
+# Initialize this dataclass, which will be used to build the logs database
+lance_logs = LanceDBLogs()
 
-resume_block_number = pl_df = logs_tbl.to_polars().select('block_number').sort(
-    by='block_number', descending=True).head(5).collect()['block_number'][0]
-print(resume_block_number)
+# the last committed block is read from the sync manifest, not from the table
+print(lance_logs.last_synced_block())
 
-# Resume the query from resume_block_number
+# Resume the query from the block after the last committed block
 start_time = time.time()
 
-# Initialize this dataclass, which will be used to build the logs database
-lance_logs = LanceDBLogs()
-lance_logs.db_sync(
-    start_block=resume_block_number, block_chunks=500)
+lance_logs.resume(block_chunks=500)
 
 print('Time took to sync base erc20 logs:', time.time() - start_time)
 
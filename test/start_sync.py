@@ -1,15 +1,17 @@
 from degen_tracker.lance import LanceDBLogs
+from degen_tracker.memory import MemoryBudget
 import time
 
-# starts a full historical sync. Currently slow because hypersync doesn't implement parallelization with current method being used.
-# Also lancedb has a bug that doesn't handle memory properly, so always ends up running out of memory to write files.
+# starts a full historical sync. Each chunk is fetched in block range shards with `concurrency` hypersync requests in flight.
+# The memory budget sizes chunks and spills staged batches to disk under memory pressure, so the sync stays within it.
 
 sart_time = time.time()
 # initialize this dataclass, which will be used to build the logs database
 lance_logs = LanceDBLogs()
 
 # initial db sync. Set start block = 2000000 for full sync. Setting at 0 crashes because not all block chunk ranges had a tx/log inside of it at the genesis of the chain.
-lance_logs.db_sync(start_block=2000000, block_chunks=2500)
+lance_logs.db_sync(start_block=2000000, block_chunks=2500, concurrency=8,
+                   memory_budget=MemoryBudget(limit=4 * 2 ** 30))
 
 print('time took to sync base erc20 logs:',
       time.time() - sart_time)
@@ -1,31 +1,33 @@
-import duckdb
-import polars as pl
-import lancedb
-import time
+import asyncio
 
+from degen_tracker.follower import LiveFollower, next_batch
 from degen_tracker.lance import LanceDBLogs
+from degen_tracker.metrics import LiveMetrics, Metrics
+from degen_tracker.tail import TailStore
 
-pl.Config.set_fmt_str_lengths(200)
-pl.Config.set_fmt_float("full")
-
-# Example that demonstrates how to resume a sync based on the latest block number in the logs database.
-# This is useful for constantly keeping the database in sync
+# Example that demonstrates how to keep following the chain after the last block in the logs database.
+# New blocks are kept in memory by the TailStore and written to lance in large batches once they are final.
+# This is the only process that may write the logs table, read it from other processes with Metrics.
+# Transfer counts of the newest blocks are computed here from the published batches, in real time.
 lance_logs = LanceDBLogs()
-
-while True:
-    # open lancedb table
-    uri: str = "logs"
-    db: lancedb.DBConnection = lancedb.connect(uri)
-    logs_tbl = db.open_table("logs")
-
-    row_count = logs_tbl.count_rows()
-
-    print("row count:", row_count)
-
-    df = pl_df = logs_tbl.to_polars().select('block_number').sort(
-        by='block_number', descending=True).collect()['block_number'][0]
-
-    print('most recent block', df)
-    lance_logs.db_sync(start_block=df,
-                       end_block=None, block_chunks=25)
-    time.sleep(5)
+follower = LiveFollower(TailStore(lance_logs))
+live_metrics = LiveMetrics(Metrics(uri=lance_logs.uri))
+
+
+async def main():
+    batches = follower.subscribe()
+    task = asyncio.create_task(follower.run())
+    try:
+        while True:
+            # raises if the follower dies instead of waiting forever
+            batch = await next_batch(batches, task)
+            live_metrics.fold(batch.df)
+            print('most recent block', batch.end_block - 1, '- rows', len(batch.df),
+                  '- last block in lance', lance_logs.last_synced_block())
+            print(live_metrics.count_transfers(limit=10).to_dicts())
+    finally:
+        # the follower writes the buffered blocks before exiting
+        follower.stop()
+        await task
+
+asyncio.run(main())
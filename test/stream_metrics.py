@@ -1,16 +1,19 @@
-
 import time
 
 from degen_tracker.metrics import Metrics
 
-
+# Streams the transfer count of the newest blocks in the logs table, read only.
+# Run it next to stream_db.py, which is the single writer of the table: blocks show up here once the
+# follower has written them to lance, i.e. at least finality_blocks (64) blocks and usually up to
+# max_buffered_blocks (900) blocks behind the chain head, minutes rather than seconds. stream_db.py prints
+# the counts of the newest blocks in real time. Never run a second follower on the same table.
 metrics = Metrics()
+newest_block = None
 
 while True:
-    print('repeating loop')
-    df = metrics.count_transfers()
-    print(f'newest block: {df["block_number"].max()}')
-    # convert output to dics and print output
-    print(df.head(10).to_dicts())
-    # wait 5 seconds before starting again
-    time.sleep(5)
+    df = metrics.count_transfers(limit=10)
+    if not df.is_empty() and df["block_number"][0] != newest_block:
+        newest_block = df["block_number"][0]
+        print(f'newest block: {newest_block}')
+        print(df.to_dicts())
+    time.sleep(1)
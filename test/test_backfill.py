@@ -0,0 +1,45 @@
+import os
+import polars as pl
+import pyarrow.parquet as pq
+
+from degen_tracker.backfill import PARTITION_SCHEMA, ParquetBackfill
+
+
+def test_fetch_resumes_at_the_missing_partitions(client):
+    backfill = ParquetBackfill(path="backfill", partition_blocks=300, client=client)
+    backfill.fetch(0, 900)
+    assert backfill.written() == [(0, 300), (300, 600), (600, 900)]
+
+    written = []
+    write_partition = backfill.write_partition
+    backfill.write_partition = lambda data, start, end: (written.append((start, end)),
+                                                         write_partition(data, start, end))
+    path = backfill.partition_path(300, 600)
+    os.remove(path)
+    backfill.fetch(0, 1_000)
+
+    assert written == [(300, 600), (900, 1_000)]
+    assert pq.read_table(path).num_rows == client.get_erc20_df(300, 600).height
+
+
+def test_load_skips_committed_partitions(logs, client):
+    backfill = ParquetBackfill(path="backfill", partition_blocks=200, client=client)
+    backfill.fetch(0, 1_000)
+    logs.db_sync(0, 400, maintenance=False)
+
+    # small commits, several partitions each
+    assert backfill.load(logs, rows_per_commit=2_000) == client.get_erc20_df(400, 1_000).height
+    assert logs.manifest.ranges == [(0, 1_000)]
+    assert logs.logs_tbl.count_rows() == client.get_erc20_df(0, 1_000).height
+    assert backfill.load(logs) == 0
+
+
+def test_empty_partitions_keep_the_partition_schema(logs):
+    backfill = ParquetBackfill(path="backfill")
+    os.makedirs(backfill.path)
+    # the chunk of blocks without transfers
+    backfill.write_partition(pl.DataFrame(), 0, 10)
+
+    assert pq.read_schema(backfill.partition_path(0, 10)).equals(PARTITION_SCHEMA)
+    assert backfill.load(logs) == 0
+    assert logs.manifest.ranges == [(0, 10)]
@@ -0,0 +1,59 @@
+import pyarrow as pa
+
+from degen_tracker.decode import address_keys, assemble_transfers
+
+
+def transfers(keys):
+    return pa.table({
+        "block_number": pa.array([block for block, _ in keys], pa.uint64()),
+        "transaction_index": pa.array([index for _, index in keys], pa.uint64()),
+    })
+
+
+def transactions(keys):
+    return pa.table({
+        "block_number": pa.array([block for block, _ in keys], pa.uint64()),
+        "transaction_index": pa.array([index for _, index in keys], pa.uint64()),
+        "from": pa.array([f"from {block}/{index}".encode() for block, index in keys], pa.binary()),
+        "to": pa.array([f"to {block}/{index}".encode() for block, index in keys], pa.binary()),
+    })
+
+
+def test_matches_every_transfer_with_its_transaction():
+    keys = [(1, 0), (1, 2), (2, 0), (5, 7)]
+    # several transfers of the same transaction, and transactions without transfers
+    joined = assemble_transfers(transfers([(1, 0), (1, 0), (2, 0), (5, 7)]), transactions(keys + [(6, 0)]))
+
+    assert joined["from"].to_pylist() == [b"from 1/0", b"from 1/0", b"from 2/0", b"from 5/7"]
+    assert joined["to"].to_pylist() == [b"to 1/0", b"to 1/0", b"to 2/0", b"to 5/7"]
+
+
+def test_unmatched_transfers_get_nulls():
+    joined = assemble_transfers(transfers([(0, 0), (1, 1), (3, 0), (9, 9)]), transactions([(1, 1), (3, 0)]))
+
+    assert joined["from"].to_pylist() == [None, b"from 1/1", b"from 3/0", None]
+    assert joined.num_rows == 4
+
+
+def test_unsorted_transactions_are_matched():
+    keys = [(1, 0), (2, 5), (2, 1), (3, 0)]
+    joined = assemble_transfers(transfers(sorted(keys) + [(4, 0)]), transactions(list(reversed(keys))))
+
+    assert joined["to"].to_pylist() == [b"to 1/0", b"to 2/1", b"to 2/5", b"to 3/0", None]
+
+
+def test_without_transactions_every_column_is_null():
+    joined = assemble_transfers(transfers([(1, 0), (2, 0)]), transactions([]), columns=("from",))
+
+    assert joined.column_names == ["block_number", "transaction_index", "from"]
+    assert joined["from"].null_count == 2
+
+
+def test_address_keys_tell_predeploys_and_precompiles_apart():
+    addresses = [bytes(20), bytes(19) + b"\x01", bytes(19) + b"\x09",
+                 bytes.fromhex("4200000000000000000000000000000000000006"),
+                 bytes.fromhex("4200000000000000000000000000000000000010"),
+                 bytes(18) + b"\xde\xad"]
+    keys = address_keys(pa.array(addresses, pa.binary(20)))
+
+    assert len(set(keys.tolist())) == len(addresses)
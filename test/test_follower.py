@@ -0,0 +1,101 @@
+import asyncio
+import lancedb
+import polars as pl
+import pytest
+
+from degen_tracker import uint256
+from degen_tracker.balances import WalletBalances
+from degen_tracker.follower import LiveFollower, TailBatch, next_batch
+from degen_tracker.hypersync import Hypersync
+from degen_tracker.lance import LanceDBLogs
+from degen_tracker.replay import ReplayClient
+from degen_tracker.tail import TailStore
+
+from test_metrics import brute_force_balances
+
+
+def follow(follower: LiveFollower, end_block: int):
+    """
+    Runs the follower until it has published end_block - 1, then stops it.
+    """
+    async def main():
+        batches = follower.subscribe()
+        task = asyncio.create_task(follower.run())
+        try:
+            while (await next_batch(batches, task)).end_block < end_block:
+                pass
+        finally:
+            follower.stop()
+            await task
+
+    asyncio.run(main())
+
+
+def test_follower_tracks_balances_of_blocks_synced_before(logs, client, source):
+    logs.db_sync(0, 1_000, block_chunks=300, maintenance=False)
+
+    tracked = LanceDBLogs(db=lancedb.connect("logs"), client=client, track_balances=True)
+    follow(LiveFollower(TailStore(tracked), poll_interval=0.01, maintenance=False), source.height)
+
+    # saved when the follower stopped, the blocks synced before it were caught up when it started
+    saved = WalletBalances.load("logs/logs_balances").state
+    balances = {(wallet, token): uint256.to_int(balance)
+                for wallet, token, balance in zip(saved["wallet"], saved["token"], saved["balance"])}
+    assert balances == brute_force_balances(client.get_erc20_df(0, source.height))
+
+
+class FlakyClient(ReplayClient):
+    """
+    Fails the first height poll and a few page requests, both mid chunk and at a chunk start.
+    """
+    failing_requests = {2, 6, 7}
+    polls = 0
+    calls = 0
+
+    async def get_height(self) -> int:
+        self.polls += 1
+        if self.polls == 1:
+            raise ConnectionError("height unavailable")
+        return await super().get_height()
+
+    async def send_req_arrow(self, query):
+        self.calls += 1
+        if self.calls in self.failing_requests:
+            raise ConnectionError("request timed out")
+        return await super().send_req_arrow(query)
+
+
+def test_follower_retries_failed_polls_and_fetches(logs, source):
+    client = Hypersync(client=FlakyClient(source, blocks_per_page=100))
+    follower = LiveFollower(TailStore(logs, client=client), poll_interval=0.01, max_backoff=0.05,
+                            maintenance=False)
+    follow(follower, source.height)
+
+    assert follower.errors == 4
+    # resumed after the written chunks, so every block is written exactly once
+    assert logs.manifest.ranges == [(0, source.height)]
+    assert logs.logs_tbl.count_rows() == source.height * source.transfers_per_block
+
+
+def test_next_batch_returns_batches_until_the_follower_dies():
+    async def main():
+        batches = asyncio.Queue()
+        failed = asyncio.Event()
+
+        async def follower():
+            await failed.wait()
+            raise ConnectionError("gone")
+
+        task = asyncio.create_task(follower())
+        batches.put_nowait(TailBatch(pl.DataFrame(), 0, 10))
+        assert (await next_batch(batches, task)).end_block == 10
+
+        failed.set()
+        with pytest.raises(ConnectionError, match="gone"):
+            await next_batch(batches, task)
+
+        stopped = asyncio.create_task(asyncio.sleep(0))
+        with pytest.raises(RuntimeError, match="stopped"):
+            await next_batch(batches, stopped)
+
+    asyncio.run(asyncio.wait_for(main(), timeout=10))
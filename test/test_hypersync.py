@@ -0,0 +1,11 @@
+import pytest
+
+
+@pytest.mark.parametrize("concurrency", [0, -1])
+def test_concurrency_below_one_is_rejected(client, concurrency):
+    with pytest.raises(ValueError, match="concurrency"):
+        client.get_erc20_df(0, 100, concurrency=concurrency)
+
+
+def test_concurrent_fetch_matches_sequential(client):
+    assert client.get_erc20_df(0, 500, concurrency=4).equals(client.get_erc20_df(0, 500))
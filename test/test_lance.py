@@ -0,0 +1,58 @@
+import lancedb
+import polars as pl
+
+from degen_tracker.lance import LanceDBLogs
+
+
+def test_append_is_idempotent(logs, client):
+    df = client.get_erc20_df(0, 300)
+
+    assert logs.append_db(df, 0, 300) == len(df)
+    assert logs.append_db(df, 0, 300) == 0
+    assert logs.logs_tbl.count_rows() == len(df)
+    assert logs.manifest.ranges == [(0, 300)]
+    assert logs.manifest.rows == len(df)
+
+
+def test_overlapping_append_only_adds_new_blocks(logs, client):
+    logs.append_db(client.get_erc20_df(0, 200), 0, 200)
+    df = client.get_erc20_df(100, 400)
+
+    new_rows = df.filter(pl.col("block_number") >= 200).height
+    assert logs.append_db(df, 100, 400) == new_rows
+    assert logs.manifest.ranges == [(0, 400)]
+
+    blocks = pl.from_arrow(logs.logs_tbl.to_lance().to_table(columns=["block_number", "transaction_index"]))
+    assert not blocks.is_duplicated().any()
+    assert len(blocks) == client.get_erc20_df(0, 400).height
+
+
+def test_append_is_idempotent_across_instances(logs, client):
+    df = client.get_erc20_df(0, 200)
+    # a second writer that loaded the table before the first one created it and committed blocks
+    other = LanceDBLogs(db=lancedb.connect("logs"), client=client)
+    logs.append_db(df.filter(pl.col("block_number") < 100), 0, 100)
+
+    assert other.append_db(df, 0, 200) == df.filter(pl.col("block_number") >= 100).height
+    logs.append_db(df, 0, 200)
+
+    assert logs.logs_tbl.count_rows() == len(df)
+    assert logs.last_synced_block() == 199
+    assert logs.manifest.rows == len(df)
+
+
+def test_resume_continues_after_the_last_block(logs, client):
+    logs.db_sync(0, 500, block_chunks=200, maintenance=False)
+    logs.resume(end_block=900, maintenance=False)
+
+    assert logs.manifest.ranges == [(0, 900)]
+    assert logs.logs_tbl.count_rows() == client.get_erc20_df(0, 900).height
+
+
+def test_token_lookup_returns_every_transfer_of_the_token(logs, client):
+    logs.db_sync(0, 300, maintenance=False)
+    df = client.get_erc20_df(0, 300)
+    token = df["token"][0]
+
+    found = logs.token_transfers(token)
+    assert len(found) == df.filter(pl.col("token") == token).height
@@ -0,0 +1,56 @@
+from degen_tracker.manifest import SyncManifest
+
+
+def test_commit_coalesces_ranges():
+    manifest = SyncManifest(path="manifest.json")
+    manifest.commit(100, 200, rows=5)
+    manifest.commit(0, 50, rows=1)
+    manifest.commit(50, 100, rows=2)
+    manifest.commit(300, 400)
+    manifest.commit(350, 450)
+
+    assert manifest.ranges == [(0, 200), (300, 450)]
+    assert manifest.rows == 8
+    assert manifest.last_block == 449
+
+
+def test_empty_commit_keeps_ranges():
+    manifest = SyncManifest(path="manifest.json")
+    manifest.commit(10, 10)
+
+    assert manifest.ranges == []
+    assert manifest.last_block is None
+
+
+def test_uncommitted_returns_the_gaps():
+    manifest = SyncManifest(path="manifest.json")
+    manifest.commit(100, 200)
+    manifest.commit(300, 400)
+
+    assert manifest.uncommitted(0, 500) == [(0, 100), (200, 300), (400, 500)]
+    assert manifest.uncommitted(150, 350) == [(200, 300)]
+    assert manifest.uncommitted(100, 200) == []
+    assert manifest.uncommitted(450, 500) == [(450, 500)]
+
+
+def test_save_and_load_round_trip():
+    manifest = SyncManifest(path="state/manifest.json")
+    manifest.commit(0, 100, rows=42)
+    manifest.save()
+
+    loaded = SyncManifest.load("state/manifest.json")
+    assert loaded.ranges == [(0, 100)]
+    assert loaded.rows == 42
+    assert SyncManifest.load("missing.json") is None
+
+
+def test_locked_reloads_the_saved_state():
+    first = SyncManifest(path="manifest.json")
+    second = SyncManifest(path="manifest.json")
+    with first.locked():
+        first.commit(0, 100, rows=3)
+        first.save()
+
+    with second.locked():
+        assert second.uncommitted(0, 200) == [(100, 200)]
+        assert second.rows == 3
@@ -0,0 +1,53 @@
+import os
+import polars as pl
+
+from degen_tracker.memory import MemoryBudget, StagedBatches, record_batches
+
+
+def frames(client, step: int = 100, end_block: int = 300):
+    return [client.get_erc20_df(start, start + step) for start in range(0, end_block, step)]
+
+
+def test_batches_spill_under_memory_pressure(client, workdir):
+    # any process is above a one byte budget
+    stage = StagedBatches(MemoryBudget(limit=1, spill_dir=str(workdir)))
+    for df in frames(client):
+        stage.append(df)
+
+    assert stage.batches == []
+    chunk = stage.take()
+    assert chunk.frames == [] and os.path.exists(chunk.spill_path)
+    assert len(chunk) == chunk.spilled_rows == client.get_erc20_df(0, 300).height
+
+    assert chunk.to_df().equals(client.get_erc20_df(0, 300))
+    assert pl.from_arrow(list(chunk.batches())).equals(chunk.to_df())
+
+    spill_path = chunk.spill_path
+    chunk.close()
+    assert not os.path.exists(spill_path)
+
+
+def test_chunk_keeps_spilled_and_in_memory_batches_in_order(client, workdir):
+    stage = StagedBatches(MemoryBudget(limit=2 ** 60, spill_dir=str(workdir)))
+    first, second, third = frames(client)
+    stage.append(first)
+    stage.spill()
+    stage.append(second)
+    stage.append(third)
+
+    chunk = stage.take()
+    assert chunk.spilled_rows == len(first) and len(chunk.frames) == 2
+    assert pl.concat([pl.from_arrow(batch) for batch in record_batches(chunk)]).equals(
+        client.get_erc20_df(0, 300))
+    chunk.close()
+
+
+def test_spilled_chunk_is_streamed_into_lance(logs, client, workdir):
+    stage = StagedBatches(MemoryBudget(limit=1, spill_dir=str(workdir)))
+    for df in frames(client):
+        stage.append(df)
+    chunk = stage.take()
+
+    assert logs.append_db(chunk, 0, 300) == client.get_erc20_df(0, 300).height
+    assert logs.logs_tbl.count_rows() == len(chunk)
+    chunk.close()
@@ -0,0 +1,119 @@
+import collections
+import lancedb
+import polars as pl
+
+from degen_tracker import uint256
+from degen_tracker.balances import ZERO_ADDRESS
+from degen_tracker.decode import hex_view
+from degen_tracker.lance import LanceDBLogs
+from degen_tracker.metrics import LiveMetrics, Metrics
+
+
+def brute_force_block_counts(df: pl.DataFrame) -> dict:
+    return {row["block_number"]: row["len"] for row in df.group_by("block_number").len().to_dicts()}
+
+
+def brute_force_address_counts(df: pl.DataFrame) -> dict:
+    senders = hex_view(df.filter(pl.col("value_transferred") != uint256.ZERO))["from"]
+    return dict(collections.Counter(senders.to_list()))
+
+
+def brute_force_balances(df: pl.DataFrame) -> dict:
+    balances = collections.defaultdict(int)
+    for row in df.select("token", "transfer_from", "transfer_to", "value_transferred").iter_rows(named=True):
+        value = uint256.to_int(row["value_transferred"])
+        balances[row["transfer_to"], row["token"]] += value
+        balances[row["transfer_from"], row["token"]] -= value
+
+    return {pair: balance % 2 ** 256 for pair, balance in balances.items()
+            if pair[0] != ZERO_ADDRESS and balance % 2 ** 256 != 0}
+
+
+def test_metrics_match_a_full_recompute(logs, client):
+    metrics = Metrics(uri="logs")
+    logs.db_sync(0, 800, block_chunks=300, maintenance=False)
+    assert metrics.count_transfers().height == 800
+
+    # the second sync is folded in incrementally
+    logs.db_sync(800, 2_000, block_chunks=300, maintenance=False)
+    df = client.get_erc20_df(0, 2_000)
+
+    block_counts = metrics.count_transfers()
+    assert dict(zip(block_counts["block_number"], block_counts["transfers_count"])) == brute_force_block_counts(df)
+    address_counts = metrics.group_by_addresses()
+    assert dict(zip(address_counts["from"], address_counts["address_swap_count"])) == brute_force_address_counts(df)
+
+    recent = metrics.group_by_addresses(since_block=1_500)
+    expected = brute_force_address_counts(df.filter(pl.col("block_number") >= 1_500))
+    assert dict(zip(recent["from"], recent["address_swap_count"])) == expected
+
+
+def test_metrics_state_survives_a_restart(logs, client):
+    logs.db_sync(0, 1_000, block_chunks=300, maintenance=False)
+    Metrics(uri="logs").count_transfers()
+    logs.db_sync(1_000, 1_500, block_chunks=300, maintenance=False)
+
+    block_counts = Metrics(uri="logs").count_transfers()
+    assert dict(zip(block_counts["block_number"], block_counts["transfers_count"])) == \
+        brute_force_block_counts(client.get_erc20_df(0, 1_500))
+
+
+def test_wallet_balances_match_a_full_recompute(client):
+    logs = LanceDBLogs(db=lancedb.connect("logs"), client=client, track_balances=True)
+    logs.db_sync(0, 2_000, block_chunks=300, maintenance=False)
+    expected = brute_force_balances(client.get_erc20_df(0, 2_000))
+
+    state = logs.balances.state
+    balances = {(wallet, token): uint256.to_int(balance)
+                for wallet, token, balance in zip(state["wallet"], state["token"], state["balance"])}
+    assert balances == expected
+
+    wallet, token = next(iter(expected))
+    assert logs.balances.balance(wallet, token) == expected[wallet, token]
+
+
+def test_wallet_balances_catch_up_from_the_table(logs, client):
+    logs.db_sync(0, 1_000, block_chunks=300, maintenance=False)
+
+    # balances enabled after the table was synced are read back from it
+    tracked = LanceDBLogs(db=lancedb.connect("logs"), client=client, track_balances=True)
+    tracked.resume(end_block=1_500, maintenance=False)
+
+    state = tracked.balances.state
+    balances = {(wallet, token): uint256.to_int(balance)
+                for wallet, token, balance in zip(state["wallet"], state["token"], state["balance"])}
+    assert balances == brute_force_balances(client.get_erc20_df(0, 1_500))
+
+
+def test_metrics_instances_sharing_the_state_fold_every_range_once(logs, client):
+    first, second = Metrics(uri="logs"), Metrics(uri="logs")
+    logs.db_sync(0, 800, block_chunks=300, maintenance=False)
+    first.count_transfers()
+    logs.db_sync(800, 1_500, block_chunks=300, maintenance=False)
+
+    # the second instance picks up the state saved by the first rather than overwriting it
+    assert second.refresh() == client.get_erc20_df(800, 1_500).height
+    assert first.refresh() == 0
+
+    expected = brute_force_block_counts(client.get_erc20_df(0, 1_500))
+    for metrics in (first, second, Metrics(uri="logs")):
+        block_counts = metrics.count_transfers()
+        assert dict(zip(block_counts["block_number"], block_counts["transfers_count"])) == expected
+
+
+def test_live_metrics_count_published_blocks_once(logs, client):
+    logs.db_sync(0, 500, block_chunks=300, maintenance=False)
+    live = LiveMetrics(Metrics(uri="logs"))
+    # published by the follower, not yet written to lance
+    for start in range(500, 700, 50):
+        live.fold(client.get_erc20_df(start, start + 50))
+
+    expected = brute_force_block_counts(client.get_erc20_df(0, 700))
+    block_counts = live.count_transfers()
+    assert dict(zip(block_counts["block_number"], block_counts["transfers_count"])) == expected
+    assert block_counts["block_number"][0] == max(expected)
+
+    logs.append_db(client.get_erc20_df(500, 600), 500, 600)
+    block_counts = live.count_transfers()
+    assert dict(zip(block_counts["block_number"], block_counts["transfers_count"])) == expected
+    assert live.block_counts["block_number"].min() >= 600
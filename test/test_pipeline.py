@@ -0,0 +1,57 @@
+import asyncio
+import pytest
+import threading
+import time
+
+from degen_tracker.chunking import AdaptiveChunker
+from degen_tracker.pipeline import SyncPipeline
+
+
+def fixed_chunks(blocks: int) -> AdaptiveChunker:
+    return AdaptiveChunker(initial_blocks=blocks, min_blocks=blocks, max_blocks=blocks)
+
+
+def test_chunks_are_written_in_order(client):
+    written = []
+    pipeline = SyncPipeline(client=client, chunker=fixed_chunks(200),
+                            write=lambda chunk, start, end: written.append((start, end, len(chunk))))
+    asyncio.run(pipeline.run(0, 1_000))
+
+    assert [(start, end) for start, end, _ in written] == [(start, start + 200) for start in range(0, 1_000, 200)]
+    assert sum(rows for _, _, rows in written) == client.get_erc20_df(0, 1_000).height
+
+
+def test_a_failed_write_stops_the_pipeline(client):
+    written = []
+
+    def write(chunk, start, end):
+        if start == 400:
+            raise OSError("disk full")
+        written.append(start)
+
+    pipeline = SyncPipeline(client=client, chunker=fixed_chunks(200), write=write)
+    with pytest.raises(OSError, match="disk full"):
+        asyncio.run(pipeline.run(0, 1_000))
+
+    assert written == [0, 200]
+
+
+def test_cancel_waits_for_the_write_in_flight(client):
+    started, written = threading.Event(), []
+
+    def write(chunk, start, end):
+        started.set()
+        time.sleep(0.2)
+        written.append(start)
+
+    async def main():
+        pipeline = SyncPipeline(client=client, chunker=fixed_chunks(200), write=write)
+        task = asyncio.create_task(pipeline.run(0, 1_000))
+        await asyncio.to_thread(started.wait)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    # the chunk being written when the pipeline was cancelled was written completely, and no other
+    assert written == [0]
@@ -0,0 +1,47 @@
+import pytest
+
+from degen_tracker.decode import EventSpec
+from degen_tracker.hypersync import Hypersync
+from degen_tracker.lance import LOGS_SCHEMA
+from degen_tracker.planner import JOIN_FIELDS, plan_fetch
+from degen_tracker.replay import ReplayClient
+
+
+def test_default_plan_fetches_every_logs_column_with_transactions():
+    plan = plan_fetch()
+
+    assert set(plan.columns) <= set(LOGS_SCHEMA.names)
+    assert plan.transaction_columns == ("from", "to")
+    assert set(plan.transaction_fields) == {*JOIN_FIELDS, "from", "to"}
+    assert set(JOIN_FIELDS) <= set(plan.log_columns)
+    assert plan.block_fields == ()
+
+
+def test_plan_without_transaction_columns_skips_transactions():
+    plan = plan_fetch(["block_number", "token", "value_transferred"])
+
+    assert plan.transaction_columns == () and plan.transaction_fields == ()
+    assert "transaction_index" not in plan.log_columns
+    assert set(EventSpec.MATCH_FIELDS) <= set(plan.log_fields)
+    assert {"address", "block_number"} <= set(plan.log_fields)
+    assert "transaction_hash" not in plan.log_fields
+
+
+def test_plan_only_requests_and_returns_its_columns(source):
+    columns = ["block_number", "token", "value_transferred"]
+    client = ReplayClient(source, blocks_per_page=100)
+    df = Hypersync(client=client, plan=plan_fetch(columns)).get_erc20_df(0, 200)
+
+    assert df.columns == columns
+    assert len(df) == 200 * source.transfers_per_block
+
+
+@pytest.mark.parametrize("columns", [["block_number", "gas_used"], []])
+def test_plan_rejects_unknown_or_no_columns(columns):
+    with pytest.raises(ValueError):
+        plan_fetch(columns)
+
+
+def test_plan_rejects_unregistered_events():
+    with pytest.raises(ValueError, match="is not registered"):
+        plan_fetch(event="Deposit(address indexed dst, uint256 wad)")
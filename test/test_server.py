@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+from degen_tracker.metrics import Metrics
+from degen_tracker.server import MetricsServer
+
+
+class FakeSocket:
+    def __init__(self, name: str, fail: bool = False):
+        self.name = name
+        self.fail = fail
+        self.pushes = 0
+
+    async def push(self):
+        self.pushes += 1
+        if self.fail:
+            raise RuntimeError("connection reset")
+
+
+def watch_until(server: MetricsServer, done) -> None:
+    async def main():
+        task = asyncio.create_task(server.watch())
+        while not done():
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(asyncio.wait_for(main(), timeout=10))
+
+
+def test_watch_survives_failed_polls_and_pushes():
+    server = MetricsServer(metrics=Metrics(uri="logs"), poll_interval=0.01)
+    polls = []
+
+    def table_state():
+        polls.append(None)
+        if len(polls) % 2:
+            raise OSError("manifest is being replaced")
+        return len(polls), ()
+
+    server.table_state = table_state
+    broken, healthy = FakeSocket("count_transfers", fail=True), FakeSocket("group_by_addresses")
+    server._sockets.update({broken, healthy})
+
+    watch_until(server, lambda: healthy.pushes >= 3)
+
+    assert broken.pushes >= 3
+    assert server.errors >= 6
+
+
+def test_cache_is_shared_until_the_table_state_changes(logs):
+    logs.db_sync(0, 300, maintenance=False)
+    server = MetricsServer(metrics=Metrics(uri="logs"), poll_interval=0.01)
+    computed = []
+    compute = server._compute
+    server._compute = lambda *args: (computed.append(args), compute(*args))[1]
+
+    async def main():
+        watcher = asyncio.create_task(server.watch())
+        try:
+            first, again = await asyncio.gather(server.get("count_transfers"), server.get("count_transfers"))
+            assert first == again and len(computed) == 1
+
+            state = server.state
+            await asyncio.to_thread(logs.db_sync, 300, 400, maintenance=False)
+            while server.state == state:
+                await asyncio.sleep(0.01)
+
+            return first, await server.get("count_transfers")
+        finally:
+            watcher.cancel()
+
+    before, after = asyncio.run(asyncio.wait_for(main(), timeout=10))
+    assert len(computed) == 2
+    assert len(json.loads(before)) == 300 and len(json.loads(after)) == 400
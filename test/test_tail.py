@@ -0,0 +1,59 @@
+import polars as pl
+
+from degen_tracker.tail import TailStore
+
+COLUMNS = ["block_number", "transaction_index", "token", "value_transferred"]
+
+
+def append(tail: TailStore, client, start_block: int, end_block: int, step: int = 50):
+    for start in range(start_block, end_block, step):
+        end = min(start + step, end_block)
+        tail.append(client.get_erc20_df(start, end), start, end)
+
+
+def test_flush_writes_only_final_blocks(logs, client):
+    tail = TailStore(logs, finality_blocks=64, flush_rows=10**9)
+    append(tail, client, 0, 300)
+    assert logs.logs_tbl is None
+
+    assert tail.flush() == client.get_erc20_df(0, 236).height
+    assert logs.manifest.ranges == [(0, 236)]
+    assert tail.start_block == 236 and tail.end_block == 300
+    # nothing is final until new blocks arrive
+    assert tail.flush() == 0
+
+    assert tail.flush(force=True) == client.get_erc20_df(236, 300).height
+    assert logs.manifest.ranges == [(0, 300)]
+    assert tail.buffer.is_empty()
+
+
+def test_blocks_become_final_finality_blocks_behind_the_newest(logs, client):
+    tail = TailStore(logs, finality_blocks=64, flush_rows=1)
+    append(tail, client, 0, 100, step=100)
+
+    # block 35 is 64 blocks behind the newest block 99, block 36 only 63
+    assert logs.manifest.ranges == [(0, 36)]
+    assert tail.buffer["block_number"].min() == 36
+    assert logs.last_synced_block() == 35
+    assert tail.last_block() == 99
+
+
+def test_quiet_chains_flush_after_max_buffered_blocks(logs, client):
+    tail = TailStore(logs, finality_blocks=10, flush_rows=10**9, max_buffered_blocks=100)
+    append(tail, client, 0, 100, step=10)
+    assert logs.manifest.ranges == []
+
+    append(tail, client, 100, 110, step=10)
+    assert logs.manifest.ranges == [(0, 100)]
+
+
+def test_recent_reads_across_the_hot_and_cold_tier(logs, client):
+    tail = TailStore(logs, finality_blocks=64, flush_rows=10**9)
+    append(tail, client, 0, 300)
+    tail.flush()
+
+    expected = client.get_erc20_df(100, 300).select(COLUMNS)
+    assert tail.recent(since_block=100, columns=COLUMNS).equals(expected)
+    # only the hot tier
+    assert tail.recent(since_block=250, columns=COLUMNS).equals(expected.filter(pl.col("block_number") >= 250))
+    assert len(tail.recent()) == client.get_erc20_df(236, 300).height
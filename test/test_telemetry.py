@@ -0,0 +1,23 @@
+from degen_tracker.telemetry import Registry
+
+
+def test_merge_adds_the_changes_of_cumulative_snapshots():
+    worker, merged = Registry(), Registry()
+    merged.count("rows_total", 5)
+
+    worker.count("rows_total", 10)
+    worker.observe("decode_seconds", 0.002)
+    first = worker.snapshot()
+    merged.merge(first)
+
+    worker.count("rows_total", 7)
+    worker.observe("decode_seconds", 3)
+    worker.observe("pages_per_chunk", 4)
+    merged.merge(worker.snapshot(), first)
+
+    assert merged.counters == {"rows_total": 22}
+    for name, histogram in worker.histograms.items():
+        assert merged.histograms[name].counts == histogram.counts
+        assert merged.histograms[name].count == histogram.count
+        assert merged.histograms[name].sum == histogram.sum
+    assert merged.histograms["pages_per_chunk"].buckets == worker.histograms["pages_per_chunk"].buckets
@@ -0,0 +1,43 @@
+import polars as pl
+import random
+
+from degen_tracker import uint256
+
+MAX = 2 ** 256 - 1
+
+
+def test_sum_is_exact():
+    values = [random.Random(i).getrandbits(256) for i in range(1_000)] + [0, 1, MAX]
+    assert uint256.sum_uint256(uint256.from_ints(values)) == sum(values)
+
+
+def test_sum_carries_across_limbs():
+    values = [2 ** 32 - 1, 2 ** 64 - 1, 2 ** 224 + 2 ** 32 - 1]
+    assert uint256.sum_uint256(uint256.from_ints(values)) == sum(values)
+
+
+def test_group_sum_wraps_around():
+    df = pl.DataFrame({
+        "token": [b"a", b"a", b"b", b"a"],
+        "value": pl.from_arrow(uint256.from_ints([MAX, 2, 7, 2 ** 200])),
+    })
+    summed = uint256.group_sum_uint256(df, "token", "value").sort("token")
+
+    assert summed["token"].to_list() == [b"a", b"b"]
+    assert [uint256.to_int(word) for word in summed["value"]] == [(MAX + 2 + 2 ** 200) % 2 ** 256, 7]
+
+
+def test_negate_is_the_additive_inverse():
+    values = [0, 1, 2 ** 32, 2 ** 255, MAX, 123456789 << 100]
+    negated = [uint256.to_int(word.as_py()) for word in uint256.negate(uint256.from_ints(values))]
+
+    assert negated == [(-value) % 2 ** 256 for value in values]
+    assert all((value + inverse) % 2 ** 256 == 0 for value, inverse in zip(values, negated))
+
+
+def test_negated_values_subtract_in_sums():
+    credits, debits = [10 ** 30, 5], [3, 10 ** 29]
+    words = pl.concat([pl.from_arrow(uint256.from_ints(credits)),
+                       pl.from_arrow(uint256.negate(uint256.from_ints(debits)))])
+
+    assert uint256.sum_uint256(words) % 2 ** 256 == sum(credits) - sum(debits)